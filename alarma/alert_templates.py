@@ -0,0 +1,93 @@
+from functools import lru_cache
+from html import escape
+
+
+# Los nombres de los miembros se repiten en cada alerta: se escapan una vez
+_escapar_nombre = lru_cache(maxsize=8192)(escape)
+
+
+class PlantillaAlerta:
+    """Mensajes de una alerta, compilados una sola vez.
+
+    Los campos que escribe el usuario (tipo, descripción, dirección, nombre)
+    se escapan para el parse_mode HTML al crear la plantilla. El mensaje
+    privado queda partido en prefijo y sufijo, y por cada miembro solo se
+    inserta su nombre.
+    """
+
+    def __init__(self, comunidad, tipo, user_id, user_name, descripcion, map_link, direccion):
+        comunidad = escape(str(comunidad).upper())
+        user_mention = f"<a href='tg://user?id={escape(str(user_id))}'>{escape(str(user_name))}</a>"
+        descripcion = escape(str(descripcion))
+        enlace = f"<a href='{escape(str(map_link))}'>Ver en Google Maps</a>"
+        direccion = escape(str(direccion))
+
+        self._prefijo = (
+            f"<b>🚨 ALERTA DE EMERGENCIA 🚨</b>\n"
+            f"<b>Tipo:</b> {escape(str(tipo))}\n"
+            f"<b>Comunidad:</b> {comunidad}\n"
+            f"<b>Usuario que activó la alarma:</b> {user_mention}\n"
+            f"<b>Descripción:</b> {descripcion}\n"
+            f"<b>Ubicación:</b> {enlace}\n"
+            f"<b>Dirección:</b> {direccion}\n\n"
+            f"¡"
+        )
+        self._sufijo = ", por favor, revisa el grupo para más detalles!"
+        self.grupo = (
+            f"<b>🚨 ALERTA ROJA ACTIVADA EN LA COMUNIDAD {comunidad}</b>\n"
+            f"<b>Activada por:</b> {user_mention}\n"
+            f"<b>Descripción:</b> {descripcion}\n"
+            f"<b>Ubicación:</b> {enlace}\n"
+            f"<b>Dirección:</b> {direccion}\n\n"
+            f"ℹ️ Se han enviado notificaciones a los miembros registrados y se ha iniciado el protocolo de llamadas."
+        )
+
+    def privado(self, nombre_miembro):
+        return self._prefijo + _escapar_nombre(str(nombre_miembro)) + self._sufijo
+
+
+def mensaje_tambien_reportado(user_id, user_name, descripcion):
+    """Aviso al grupo cuando otro vecino reporta una alerta que ya está en curso."""
+    return (
+        f"ℹ️ <b>También reportado por:</b> "
+        f"<a href='tg://user?id={escape(str(user_id))}'>{escape(str(user_name))}</a>\n"
+        f"<b>Descripción:</b> {escape(str(descripcion))}"
+    )
+
+
+def _benchmark(n_miembros=1000, repeticiones=50):
+    """Compara la plantilla con el bucle de f-strings que usaba handle_alert."""
+    import timeit
+
+    miembros = [{"nombre": f"Vecino {i}", "telegram_id": i} for i in range(n_miembros)]
+    campos = dict(comunidad="brisas", tipo="Alerta Roja Activada", user_id=1, user_name="Larry",
+                  descripcion="Robo en la esquina <urgente>", direccion="Av. Principal 101",
+                  map_link="https://www.google.com/maps/search/?api=1&query=-12.04,-77.04")
+
+    def con_fstrings():
+        user_mention = f"<a href='tg://user?id={campos['user_id']}'>{campos['user_name']}</a>"
+        for miembro in miembros:
+            nombre_miembro = miembro.get('nombre', 'miembro')
+            (
+                f"<b>🚨 ALERTA DE EMERGENCIA 🚨</b>\n"
+                f"<b>Tipo:</b> {campos['tipo']}\n"
+                f"<b>Comunidad:</b> {campos['comunidad'].upper()}\n"
+                f"<b>Usuario que activó la alarma:</b> {user_mention}\n"
+                f"<b>Descripción:</b> {campos['descripcion']}\n"
+                f"<b>Ubicación:</b> <a href='{campos['map_link']}'>Ver en Google Maps</a>\n"
+                f"<b>Dirección:</b> {campos['direccion']}\n\n"
+                f"¡{nombre_miembro}, por favor, revisa el grupo para más detalles!"
+            )
+
+    def con_plantilla():
+        plantilla = PlantillaAlerta(**campos)
+        for miembro in miembros:
+            plantilla.privado(miembro.get('nombre', 'miembro'))
+
+    for nombre, funcion in (("f-strings", con_fstrings), ("plantilla", con_plantilla)):
+        segundos = min(timeit.repeat(funcion, number=repeticiones, repeat=5)) / repeticiones
+        print(f"{nombre:>10}: {segundos * 1000:.3f} ms por alerta de {n_miembros} miembros")
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -0,0 +1,145 @@
+import json
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db import ESTADO_DB, Periodico, conexion
+from hilos import iniciar_hilos
+from logs import logger
+from rate_limit import TokenBuckets
+
+log = logger("llamadas")
+
+# 📞 Llamadas por segundo que permite la cuenta de Twilio (por defecto 1 CPS)
+TWILIO_CPS = float(os.getenv("TWILIO_CPS", "1"))
+# 🗂️ Cuántas campañas recientes se recuerdan
+CAMPANAS_MAX_HISTORIAL = int(os.getenv("CAMPANAS_MAX_HISTORIAL", "500"))
+# 🧵 Llamadas que se crean a la vez en la API de Twilio, ya con el CPS respetado
+TWILIO_HILOS = int(os.getenv("TWILIO_HILOS", "4"))
+
+# Estados de Twilio que ya no van a cambiar
+ESTADOS_FINALES = {"completed", "busy", "no-answer", "failed", "canceled"}
+
+
+class CallCampaigns:
+    """Llamadas de cada alerta, lanzadas en paralelo sin pasar el límite de CPS.
+
+    Guarda el SID de cada llamada y su último estado, que Twilio actualiza
+    llamando a /twilio-voice/status (queued, ringing, in-progress, completed,
+    busy, no-answer, failed...). Vive en SQLite: el callback de Twilio y
+    GET /api/alert/<id> pueden llegar a un worker distinto del que llamó.
+
+    `llamar` solo encola: un hilo propio reparte los turnos de CPS y crea las
+    llamadas en un pool aparte, así las llamadas frenadas por el CPS no ocupan
+    los hilos del fan-out ni retrasan los mensajes de Telegram.
+    """
+
+    def __init__(self, cps=TWILIO_CPS, hilos=TWILIO_HILOS, ruta=ESTADO_DB, max_historial=CAMPANAS_MAX_HISTORIAL):
+        self.ruta = ruta
+        self.max_historial = max_historial
+        self.cps = cps
+        # El CPS es de la cuenta de Twilio: el bucket se comparte entre workers
+        self._limites = TokenBuckets(ruta)
+        self._cola = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=hilos)
+        self._limpieza = Periodico()
+        with conexion(self.ruta) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llamadas (alert_id TEXT, numero TEXT, sid TEXT, estado TEXT, "
+                "datos TEXT DEFAULT '{}', secuencia INTEGER, creada REAL, PRIMARY KEY (alert_id, numero))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS llamadas_sid ON llamadas (sid)")
+        self._hilo, = iniciar_hilos(self._repartir)
+
+    def _esperar_turno(self):
+        while True:
+            espera, _ = self._limites.tomar([("twilio", self.cps, max(self.cps, 1))])
+            if espera == 0:
+                return
+            time.sleep(espera)
+
+    def _repartir(self):
+        while True:
+            alert_id, numero, crear = self._cola.get()
+            self._esperar_turno()
+            self._pool.submit(self._crear, alert_id, numero, crear)
+
+    def _limpiar(self, conn):
+        if not self._limpieza.toca():
+            return
+        conn.execute(
+            "DELETE FROM llamadas WHERE alert_id NOT IN "
+            "(SELECT alert_id FROM llamadas GROUP BY alert_id ORDER BY MAX(creada) DESC LIMIT ?)",
+            (self.max_historial,)
+        )
+
+    def llamar(self, alert_id, numero, crear):
+        """Encola `crear(numero)`, que se lanza respetando el CPS. Devuelve "pendiente".
+
+        El SID y el resultado de cada llamada se ven en `progreso(alert_id)`.
+        """
+        ahora = time.time()
+        with conexion(self.ruta) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llamadas (alert_id, numero, sid, estado, creada) "
+                "VALUES (?, ?, NULL, 'pendiente', ?)",
+                (alert_id, numero, ahora)
+            )
+            self._limpiar(conn)
+        self._cola.put((alert_id, numero, crear))
+        return "pendiente"
+
+    def _crear(self, alert_id, numero, crear):
+        try:
+            sid = crear(numero)
+        except Exception as e:
+            log.warning("ERROR al llamar a %s: %s", numero, e, extra={"alert_id": alert_id})
+            self._guardar(alert_id, numero, estado="failed", datos={"error": str(e)})
+            return
+        self._guardar(alert_id, numero, sid=sid, estado="queued")
+
+    def _guardar(self, alert_id, numero, sid=None, estado=None, datos=None):
+        with conexion(self.ruta) as conn:
+            conn.execute(
+                "UPDATE llamadas SET sid = COALESCE(?, sid), estado = ?, datos = json_patch(datos, ?) "
+                "WHERE alert_id = ? AND numero = ?",
+                (sid, estado, json.dumps(datos or {}), alert_id, numero)
+            )
+
+    def actualizar_estado(self, sid, estado, secuencia=None, **datos):
+        """Registra un status callback de Twilio. Devuelve False si el SID no es conocido o el evento es viejo.
+
+        Los callbacks pueden llegar desordenados y a workers distintos: un
+        estado final no se pisa, y con `secuencia` (el SequenceNumber de
+        Twilio) se ignoran los eventos anteriores al último guardado.
+        """
+        finales = ",".join("?" * len(ESTADOS_FINALES))
+        with conexion(self.ruta) as conn:
+            cursor = conn.execute(
+                "UPDATE llamadas SET estado = ?, datos = json_patch(datos, ?), secuencia = COALESCE(?, secuencia) "
+                f"WHERE sid = ? AND estado NOT IN ({finales}) AND (? IS NULL OR secuencia IS NULL OR secuencia < ?)",
+                (estado, json.dumps(datos), secuencia, sid, *ESTADOS_FINALES, secuencia, secuencia)
+            )
+        return cursor.rowcount > 0
+
+    def progreso(self, alert_id):
+        """Resumen de la campaña: totales por estado y detalle de cada llamada."""
+        filas = conexion(self.ruta).execute(
+            "SELECT numero, sid, estado, datos FROM llamadas WHERE alert_id = ? ORDER BY creada, rowid",
+            (alert_id,)
+        ).fetchall()
+        if not filas:
+            return None
+        llamadas = [{"numero": numero, "sid": sid, "estado": estado, **json.loads(datos)}
+                    for numero, sid, estado, datos in filas]
+        por_estado = {}
+        for llamada in llamadas:
+            por_estado[llamada["estado"]] = por_estado.get(llamada["estado"], 0) + 1
+        terminadas = sum(1 for llamada in llamadas if llamada["estado"] in ESTADOS_FINALES)
+        return {
+            "total": len(llamadas),
+            "terminadas": terminadas,
+            "por_estado": por_estado,
+            "llamadas": llamadas,
+        }
@@ -0,0 +1,66 @@
+import os
+import time
+
+from db import ESTADO_DB, conexion
+
+# ⏳ Segundos durante los que alertas iguales se funden en una sola
+COALESCE_VENTANA = int(os.getenv("COALESCE_VENTANA", "120"))
+# 🗺️ Tamaño de la celda de ubicación en grados (~0.002° ≈ 200 m)
+COALESCE_CELDA = float(os.getenv("COALESCE_CELDA", "0.002"))
+
+
+def _celda(lat, lon, celda):
+    return int(float(lat) // celda), int(float(lon) // celda)
+
+
+class AlertCoalescer:
+    """Funde las alertas repetidas de un mismo incidente.
+
+    Dos alertas son el mismo incidente si son de la misma comunidad y tipo,
+    llegan dentro de la ventana y caen en la misma celda de ubicación o en
+    una vecina. Solo la primera hace el envío completo. Vive en SQLite para
+    que funcione aunque las peticiones lleguen a workers distintos.
+    """
+
+    def __init__(self, ruta=ESTADO_DB, ventana=COALESCE_VENTANA, celda=COALESCE_CELDA):
+        self.ruta = ruta
+        self.ventana = ventana
+        self.celda = celda
+        with conexion(self.ruta) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS alertas_recientes "
+                "(clave TEXT PRIMARY KEY, alert_id TEXT, expira REAL)"
+            )
+
+    def _claves(self, comunidad, tipo, lat, lon):
+        base = f"{comunidad.lower()}|{tipo}"
+        try:
+            x, y = _celda(lat, lon, self.celda)
+        except (TypeError, ValueError):
+            return [f"{base}|sin_ubicacion"]
+        # La propia celda primero: es la que se guarda si la alerta es nueva
+        return [f"{base}|{x + dx},{y + dy}" for dx, dy in
+                ((0, 0), (-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))]
+
+    def registrar(self, comunidad, tipo, lat, lon, alert_id):
+        """Devuelve None si la alerta es nueva o el alert_id de la que ya la cubre."""
+        claves = self._claves(comunidad, tipo, lat, lon)
+        ahora = time.time()
+        conn = conexion(self.ruta)
+        with conn:
+            # BEGIN IMMEDIATE: dos workers no pueden decidir a la vez que son la primera
+            conn.execute("BEGIN IMMEDIATE")
+            marcas = ",".join("?" * len(claves))
+            fila = conn.execute(
+                f"SELECT alert_id FROM alertas_recientes WHERE clave IN ({marcas}) AND expira > ? "
+                "ORDER BY expira LIMIT 1",
+                (*claves, ahora)
+            ).fetchone()
+            if fila:
+                return fila[0]
+            conn.execute("DELETE FROM alertas_recientes WHERE expira <= ?", (ahora,))
+            conn.execute(
+                "INSERT OR REPLACE INTO alertas_recientes (clave, alert_id, expira) VALUES (?, ?, ?)",
+                (claves[0], alert_id, ahora + self.ventana)
+            )
+        return None
@@ -0,0 +1,137 @@
+import threading
+import time
+
+
+class Comando:
+    __slots__ = ("nombre", "funcion", "chats", "en_linea")
+
+    def __init__(self, nombre, funcion, chats=None, en_linea=False):
+        self.nombre = nombre
+        self.funcion = funcion
+        # Tipos de chat permitidos ("private", "group", "supergroup"...); None = todos
+        self.chats = frozenset(chats) if chats else None
+        # Comando de una sola respuesta rápida: se puede contestar en el cuerpo del webhook
+        self.en_linea = en_linea
+
+
+def normalizar(texto, bot=None):
+    """Nombre del comando y argumentos de un texto, o (None, '') si no es para este bot.
+
+    Acepta `sos`, `SOS`, `/sos` y `/sos@mibot`; con `/cmd@otrobot` devuelve
+    None para no responder a comandos dirigidos a otro bot del grupo. Una
+    palabra sin `/` solo es comando si es todo el mensaje: "SOS alguien vio
+    un auto rojo?" es conversación, no una emergencia. Solo `/cmd` lleva
+    argumentos.
+    """
+    texto = texto.strip()
+    if not texto.startswith('/'):
+        if not texto or len(texto.split(None, 1)) > 1:
+            return None, ''
+        return texto.lower(), ''
+    partes = texto.split(None, 1)
+    nombre = partes[0][1:]
+    nombre, _, destino = nombre.partition('@')
+    if destino and bot and destino.lower() != bot:
+        return None, ''
+    return nombre.lower(), partes[1] if len(partes) > 1 else ''
+
+
+class CommandRouter:
+    """Registro de comandos del bot con despacho por dict.
+
+    El texto se normaliza una vez y se busca en un dict (alias incluidos),
+    así agregar comandos no hace más lenta cada actualización como una
+    cadena de if/elif. Cada comando puede limitarse a ciertos tipos de chat.
+    También mide cuánto tarda cada comando (`metricas`).
+    """
+
+    def __init__(self, bot=None):
+        self.bot = bot.lower().lstrip('@') if bot else None
+        self._comandos = {}
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def comando(self, nombre, *alias, chats=None, en_linea=False):
+        """Decorador: registra `funcion(message, args, responder)` para `nombre` y sus alias."""
+        def registrar(funcion):
+            comando = Comando(nombre.lower(), funcion, chats=chats, en_linea=en_linea)
+            for clave in (nombre, *alias):
+                self._comandos[clave.lower()] = comando
+            return funcion
+        return registrar
+
+    def resolver(self, message):
+        """(Comando, args) para el mensaje, o (None, '') si no hay comando que lo atienda."""
+        texto = message.get('text')
+        if not texto:
+            return None, ''
+        nombre, args = normalizar(texto, self.bot)
+        comando = self._comandos.get(nombre)
+        if comando is None:
+            return None, ''
+        if comando.chats is not None and message.get('chat', {}).get('type') not in comando.chats:
+            return None, ''
+        return comando, args
+
+    def despachar(self, message, responder):
+        """Ejecuta el comando del mensaje. Devuelve False si no había ninguno."""
+        comando, args = self.resolver(message)
+        if comando is None:
+            return False
+        inicio = time.perf_counter()
+        try:
+            comando.funcion(message, args, responder)
+        finally:
+            self._medir(comando.nombre, time.perf_counter() - inicio)
+        return True
+
+    def _medir(self, nombre, segundos):
+        with self._lock:
+            metrica = self._metricas.get(nombre)
+            if metrica is None:
+                metrica = self._metricas[nombre] = [0, 0.0, 0.0]
+            metrica[0] += 1
+            metrica[1] += segundos
+            metrica[2] = max(metrica[2], segundos)
+
+    def metricas(self):
+        """{comando: {"llamadas", "ms_promedio", "ms_max"}} desde que arrancó el proceso."""
+        with self._lock:
+            return {
+                nombre: {
+                    "llamadas": llamadas,
+                    "ms_promedio": round(total / llamadas * 1000, 3),
+                    "ms_max": round(maximo * 1000, 3),
+                }
+                for nombre, (llamadas, total, maximo) in self._metricas.items()
+            }
+
+
+def _benchmark(repeticiones=100000):
+    """Compara buscar el comando en el dict con la cadena de if/elif que usaba process_update."""
+    import timeit
+
+    for n_comandos in (5, 50, 500):
+        nombres = [f"comando{i}" for i in range(n_comandos)]
+        router = CommandRouter(bot="alarmabot")
+        for nombre in nombres:
+            router.comando(nombre)(lambda message, args, responder: None)
+        message = {"chat": {"type": "group"}, "text": f"/{nombres[-1]}@alarmabot"}
+
+        def con_cadena():
+            # El peor caso de la cadena: el comando es el último
+            texto = nombres[-1].upper()
+            for nombre in nombres:
+                if texto.lower() == nombre:
+                    return True
+            return False
+
+        pruebas = (("if/elif", con_cadena), ("router", lambda: router.resolver(message)),
+                   ("router+métricas", lambda: router.despachar(message, None)))
+        for nombre, funcion in pruebas:
+            segundos = min(timeit.repeat(funcion, number=repeticiones, repeat=5)) / repeticiones
+            print(f"{nombre:>16}: {segundos * 1e6:.2f} µs por update con {n_comandos} comandos")
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -0,0 +1,284 @@
+import abc
+import json
+import os
+import threading
+import time
+
+import snapshot as snapshot_mod
+from geo_index import GeoIndex, coordenadas
+from logs import logger
+
+log = logger("comunidades")
+
+# ⏱️ Cada cuántos segundos se revisa si cambió algún archivo de comunidades/
+REGISTRY_INTERVALO = float(os.getenv("REGISTRY_INTERVALO", "0.5"))
+
+
+def normalizar_telefono(telefono):
+    return ''.join(c for c in str(telefono) if c.isdigit() or c == '+')
+
+
+def _chats(info):
+    if not isinstance(info, dict):
+        return []
+    return [str(info[clave]) for clave in ('chat_id', 'telegram_chat_id') if info.get(clave)]
+
+
+class MiembrosIndex:
+    """Índices de los miembros de una comunidad, construidos al cargarla.
+
+    Los telegram_id se normalizan a str una sola vez, así buscar al
+    reportante o armar la lista de destinatarios no vuelve a convertirlos.
+    Los miembros con alertas y `geolocalizacion` van además a un GeoIndex
+    para ordenarlos por distancia a la alerta.
+    """
+
+    __slots__ = ("por_telegram_id", "por_telefono", "con_alertas", "geo", "sin_ubicacion")
+
+    def __init__(self, miembros):
+        self.por_telegram_id = {}
+        self.por_telefono = {}
+        con_alertas = []
+        puntos = []
+        sin_ubicacion = []
+        for miembro in miembros:
+            telegram_id = miembro.get('telegram_id')
+            clave = str(telegram_id) if telegram_id is not None else None
+            if clave is not None:
+                self.por_telegram_id[clave] = miembro
+            if miembro.get('telefono'):
+                self.por_telefono[normalizar_telefono(miembro['telefono'])] = miembro
+            if miembro.get('alertas_activadas'):
+                con_alertas.append((clave, miembro))
+                ubicacion = coordenadas(miembro.get('geolocalizacion'))
+                if ubicacion:
+                    puntos.append((*ubicacion, (clave, miembro)))
+                else:
+                    sin_ubicacion.append((clave, miembro))
+        # (telegram_id normalizado, miembro) de quienes tienen las alertas activadas
+        self.con_alertas = tuple(con_alertas)
+        self.geo = GeoIndex(puntos)
+        self.sin_ubicacion = tuple(sin_ubicacion)
+
+    def destinatarios(self, excluir_telegram_id=None, lat=None, lon=None, radio_m=None):
+        """Miembros con alertas activadas, sin el que activó la alarma.
+
+        Con la ubicación de la alerta van primero los más cercanos, y los que
+        no tienen `geolocalizacion` al final. Con `radio_m` solo se incluyen
+        los que están a esa distancia o menos.
+        """
+        excluir = str(excluir_telegram_id) if excluir_telegram_id is not None else None
+        if lat is None or lon is None:
+            return [miembro for clave, miembro in self.con_alertas if clave != excluir]
+        if radio_m:
+            return [miembro for _, (clave, miembro) in self.geo.dentro_de(lat, lon, radio_m) if clave != excluir]
+        cercanos = [miembro for clave, miembro in self.geo.ordenar(lat, lon) if clave != excluir]
+        return cercanos + [miembro for clave, miembro in self.sin_ubicacion if clave != excluir]
+
+
+class CommunitySource(abc.ABC):
+    """Interfaz de lectura común de los backends de comunidades.
+
+    servidor.py solo usa estos métodos, así que da igual si las comunidades
+    vienen de los JSON (CommunityRegistry) o de SQLite (SqliteCommunityStore).
+    Las escrituras son solo de SqliteCommunityStore: los JSON no se modifican.
+    """
+
+    @abc.abstractmethod
+    def get(self, nombre):
+        """Datos de la comunidad como en su JSON, o None si no existe."""
+
+    @abc.abstractmethod
+    def miembros(self, nombre):
+        """MiembrosIndex de la comunidad, o None si no existe."""
+
+    @abc.abstractmethod
+    def por_chat_id(self, chat_id):
+        """Nombre de la comunidad asociada a un chat de Telegram, o None."""
+
+    @abc.abstractmethod
+    def nombres(self):
+        """Nombres de todas las comunidades."""
+
+    @abc.abstractmethod
+    def comunidad_de(self, telegram_id):
+        """Comunidad donde figura ese telegram_id como miembro, o None. Es una búsqueda indexada."""
+
+    def iniciar_vigilancia(self):
+        """Los backends que leen archivos los vigilan aquí; los demás no hacen nada."""
+
+
+class CommunityRegistry(CommunitySource):
+    """Comunidades de un directorio de JSON, parseadas una sola vez y servidas desde memoria.
+
+    Un hilo vigila el directorio comparando mtime y tamaño de cada archivo y
+    solo vuelve a leer los que cambiaron. Las consultas nunca tocan el disco.
+    Los dicts devueltos se comparten entre peticiones: no hay que modificarlos.
+
+    También mantiene índices inversos chat_id -> comunidad (acepta tanto
+    `chat_id` como `telegram_chat_id`) y telegram_id -> comunidad que se
+    actualizan solo para los archivos que cambian, y un MiembrosIndex por
+    comunidad que se arma la primera vez que se pide.
+
+    Con un snapshot (ver snapshot.py) el arranque solo lee su índice: las
+    comunidades quedan pendientes y se decodifican al primer acceso.
+    """
+
+    def __init__(self, directorio, intervalo=REGISTRY_INTERVALO, snapshot=None):
+        self.directorio = directorio
+        self.intervalo = intervalo
+        self._comunidades = {}
+        self._pendientes = {}
+        self._por_chat = {}
+        self._por_telegram = {}
+        self._miembros = {}
+        self._firmas = {}
+        self._lock = threading.Lock()
+        self._hilo = None
+        if snapshot:
+            self._sembrar(snapshot_mod.cargar(snapshot))
+        self.recargar()
+
+    def _sembrar(self, compilado):
+        """Arranque en caliente desde un snapshot; luego solo se releen los JSON que cambiaron."""
+        if compilado is None:
+            return
+        with self._lock:
+            self._pendientes = {nombre: compilado for nombre in compilado.entradas}
+            self._por_chat = {chat: nombre for nombre, (chats, _, _) in compilado.entradas.items() for chat in chats}
+            self._por_telegram = {telegram_id: nombre for nombre, (_, ids, _) in compilado.entradas.items()
+                                  for telegram_id in ids}
+            self._firmas = {nombre: firma for nombre, (_, _, firma) in compilado.entradas.items()}
+        log.info("%d comunidades indexadas desde el snapshot", len(self._pendientes))
+
+    def get(self, nombre):
+        nombre = nombre.lower()
+        info = self._comunidades.get(nombre)
+        if info is None and nombre in self._pendientes:
+            info = self._decodificar(nombre)
+        return info
+
+    def _decodificar(self, nombre):
+        with self._lock:
+            compilado = self._pendientes.get(nombre)
+            if compilado is None:
+                # Otro hilo la decodificó (o una recarga la reemplazó) mientras se esperaba el lock
+                return self._comunidades.get(nombre)
+            info = compilado.datos(nombre)
+            self._comunidades = {**self._comunidades, nombre: info}
+            self._pendientes = {n: c for n, c in self._pendientes.items() if n != nombre}
+            return info
+
+    def miembros(self, nombre):
+        """MiembrosIndex de la comunidad, o None si no existe."""
+        nombre = nombre.lower()
+        indice = self._miembros.get(nombre)
+        if indice is not None:
+            return indice
+        info = self.get(nombre)
+        if info is None:
+            return None
+        lista = info.get('miembros', []) if isinstance(info, dict) else info
+        indice = MiembrosIndex(lista if isinstance(lista, list) else [])
+        with self._lock:
+            # Si una recarga cambió la comunidad mientras tanto, no se guarda un índice viejo
+            if self._comunidades.get(nombre) is info:
+                self._miembros = {**self._miembros, nombre: indice}
+        return indice
+
+    def por_chat_id(self, chat_id):
+        """Nombre de la comunidad asociada a un chat de Telegram, o None."""
+        return self._por_chat.get(str(chat_id))
+
+    def nombres(self):
+        return sorted(self._comunidades.keys() | self._pendientes.keys())
+
+    def comunidad_de(self, telegram_id):
+        return self._por_telegram.get(str(telegram_id))
+
+    def recargar(self):
+        """Relee solo los archivos nuevos o modificados y olvida los borrados."""
+        with self._lock:
+            try:
+                archivos = [a for a in os.listdir(self.directorio) if a.endswith('.json')]
+            except FileNotFoundError:
+                archivos = []
+
+            comunidades = dict(self._comunidades)
+            pendientes = dict(self._pendientes)
+            firmas = {}
+            presentes = set()
+            cambios = False
+            for archivo in archivos:
+                nombre = archivo[:-len('.json')].lower()
+                presentes.add(nombre)
+                filepath = os.path.join(self.directorio, archivo)
+                try:
+                    st = os.stat(filepath)
+                except FileNotFoundError:
+                    continue
+                firma = (st.st_mtime_ns, st.st_size)
+                firmas[nombre] = firma
+                if self._firmas.get(nombre) == firma:
+                    continue
+                try:
+                    with open(filepath, 'r', encoding='utf-8') as f:
+                        comunidades[nombre] = json.load(f)
+                    log.info("Comunidad '%s' cargada en memoria", nombre)
+                except Exception as e:
+                    # Si el archivo está a medio escribir se reintenta en la siguiente vuelta
+                    log.error("ERROR al cargar '%s': %s", filepath, e)
+                    firmas.pop(nombre)
+                    if nombre in pendientes:
+                        # Se conserva la firma del snapshot para no perder la comunidad
+                        firmas[nombre] = self._firmas[nombre]
+                    continue
+                pendientes.pop(nombre, None)
+                cambios = True
+
+            for nombre in (comunidades.keys() | pendientes.keys()) - presentes:
+                comunidades.pop(nombre, None)
+                pendientes.pop(nombre, None)
+                cambios = True
+
+            self._firmas = firmas
+            if cambios:
+                por_chat = self._indexar(self._por_chat, comunidades, pendientes, _chats)
+                por_telegram = self._indexar(self._por_telegram, comunidades, pendientes, snapshot_mod.telegram_ids)
+                # Los índices de las comunidades que cambiaron se vuelven a armar al pedirlos
+                miembros = {nombre: indice for nombre, indice in self._miembros.items()
+                            if nombre in comunidades and comunidades[nombre] is self._comunidades.get(nombre)}
+                # Se reemplazan los dicts completos para que los lectores no necesiten lock
+                self._comunidades = comunidades
+                self._pendientes = pendientes
+                self._por_chat = por_chat
+                self._por_telegram = por_telegram
+                self._miembros = miembros
+            return cambios
+
+    def _indexar(self, anterior, comunidades, pendientes, claves_de):
+        """Índice inverso clave -> comunidad: se conserva lo de las que no cambiaron y se rehace el resto."""
+        indice = {clave: nombre for clave, nombre in anterior.items()
+                  if (nombre in comunidades or nombre in pendientes)
+                  and comunidades.get(nombre) is self._comunidades.get(nombre)}
+        for nombre, info in comunidades.items():
+            if info is self._comunidades.get(nombre):
+                continue
+            for clave in claves_de(info):
+                indice[clave] = nombre
+        return indice
+
+    def iniciar_vigilancia(self):
+        with self._lock:
+            if self._hilo:
+                return
+            self._hilo = threading.Thread(target=self._vigilar, daemon=True)
+            self._hilo.start()
+
+    def _vigilar(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                self.recargar()
+            except Exception as e:
+                log.exception("ERROR al vigilar '%s': %s", self.directorio, e)
@@ -0,0 +1,197 @@
+"""Backend SQLite de comunidades, miembros, chats y registros.
+
+Uso:  python community_store.py [directorio_comunidades] [archivo_db]
+      (importa los JSON del directorio a la base)
+"""
+import json
+import os
+import sys
+import time
+
+from community_registry import CommunitySource, MiembrosIndex, normalizar_telefono
+from db import conexion
+from logs import logger
+
+log = logger("comunidades")
+
+# 🗄️ Base SQLite con las comunidades (COMUNIDADES_BACKEND=sqlite en servidor.py)
+COMUNIDADES_DB = os.getenv("COMUNIDADES_DB", "comunidades.sqlite3")
+
+_CHATS = ('chat_id', 'telegram_chat_id')
+
+
+class SqliteCommunityStore(CommunitySource):
+    """Comunidades en tablas SQLite indexadas, en modo WAL.
+
+    Cada worker lee sin bloquear a los demás y las escrituras tocan solo las
+    filas afectadas en vez de reescribir un JSON completo. Cada comunidad
+    tiene un número de versión que sube con cada escritura: el worker guarda
+    en memoria los datos y el MiembrosIndex de la última versión que leyó y
+    solo vuelve a consultar los miembros cuando la versión cambió.
+    """
+
+    def __init__(self, ruta=COMUNIDADES_DB):
+        self.ruta = ruta
+        self._cache = {}
+        with conexion(self.ruta) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS comunidades "
+                "(nombre TEXT PRIMARY KEY, datos TEXT NOT NULL, version INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS comunidad_chats (chat_id TEXT PRIMARY KEY, comunidad TEXT NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS comunidad_chats_comunidad ON comunidad_chats (comunidad)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS miembros "
+                "(id INTEGER PRIMARY KEY, comunidad TEXT NOT NULL, telegram_id TEXT, telefono TEXT, datos TEXT NOT NULL)"
+            )
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS miembros_comunidad_telegram ON miembros (comunidad, telegram_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS miembros_telegram ON miembros (telegram_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS miembros_telefono ON miembros (telefono)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS registros "
+                "(id INTEGER PRIMARY KEY, telegram_id TEXT NOT NULL, comunidad TEXT, miembro INTEGER NOT NULL, "
+                "datos TEXT NOT NULL, creado REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS registros_telegram ON registros (telegram_id)")
+
+    def _cargar(self, nombre):
+        """(version, datos, MiembrosIndex) de la comunidad, o None si no existe."""
+        nombre = nombre.lower()
+        conn = conexion(self.ruta)
+        with conn:
+            # Una sola transacción de lectura: la versión y los miembros son de la misma foto
+            conn.execute("BEGIN")
+            fila = conn.execute("SELECT datos, version FROM comunidades WHERE nombre = ?", (nombre,)).fetchone()
+            if fila is None:
+                self._cache.pop(nombre, None)
+                return None
+            cacheada = self._cache.get(nombre)
+            if cacheada is not None and cacheada[0] == fila[1]:
+                return cacheada
+            miembros = [json.loads(datos) for (datos,) in conn.execute(
+                "SELECT datos FROM miembros WHERE comunidad = ? ORDER BY id", (nombre,)
+            )]
+        info = json.loads(fila[0])
+        info['miembros'] = miembros
+        cacheada = self._cache[nombre] = (fila[1], info, MiembrosIndex(miembros))
+        return cacheada
+
+    def get(self, nombre):
+        cargada = self._cargar(nombre)
+        return cargada[1] if cargada else None
+
+    def miembros(self, nombre):
+        cargada = self._cargar(nombre)
+        return cargada[2] if cargada else None
+
+    def por_chat_id(self, chat_id):
+        fila = conexion(self.ruta).execute(
+            "SELECT comunidad FROM comunidad_chats WHERE chat_id = ?", (str(chat_id),)
+        ).fetchone()
+        return fila[0] if fila else None
+
+    def nombres(self):
+        return [nombre for (nombre,) in conexion(self.ruta).execute("SELECT nombre FROM comunidades ORDER BY nombre")]
+
+    def comunidad_de(self, telegram_id):
+        fila = conexion(self.ruta).execute(
+            "SELECT comunidad FROM miembros WHERE telegram_id = ? LIMIT 1", (str(telegram_id),)
+        ).fetchone()
+        return fila[0] if fila else None
+
+    def guardar_comunidad(self, nombre, info):
+        """Crea o reemplaza una comunidad completa con el formato de sus JSON."""
+        nombre = nombre.lower()
+        if isinstance(info, list):
+            info = {'miembros': info}
+        miembros = info.get('miembros', [])
+        datos = {clave: valor for clave, valor in info.items() if clave != 'miembros'}
+        conn = conexion(self.ruta)
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO comunidades (nombre, datos, version) VALUES (?, ?, 1) "
+                "ON CONFLICT(nombre) DO UPDATE SET datos = excluded.datos, version = version + 1",
+                (nombre, json.dumps(datos, ensure_ascii=False))
+            )
+            conn.execute("DELETE FROM comunidad_chats WHERE comunidad = ?", (nombre,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO comunidad_chats (chat_id, comunidad) VALUES (?, ?)",
+                [(str(info[clave]), nombre) for clave in _CHATS if info.get(clave)]
+            )
+            conn.execute("DELETE FROM miembros WHERE comunidad = ?", (nombre,))
+            # OR REPLACE: si un telegram_id se repite en el JSON gana el último, igual que en MiembrosIndex
+            conn.executemany(
+                "INSERT OR REPLACE INTO miembros (comunidad, telegram_id, telefono, datos) VALUES (?, ?, ?, ?)",
+                [self._fila_miembro(nombre, miembro) for miembro in miembros if isinstance(miembro, dict)]
+            )
+
+    def guardar_miembro(self, comunidad, miembro):
+        """Agrega o actualiza (por telegram_id) un miembro. Devuelve False si la comunidad no existe."""
+        comunidad = comunidad.lower()
+        conn = conexion(self.ruta)
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cambio = conn.execute(
+                "UPDATE comunidades SET version = version + 1 WHERE nombre = ?", (comunidad,)
+            ).rowcount
+            if not cambio:
+                return False
+            conn.execute(
+                "INSERT INTO miembros (comunidad, telegram_id, telefono, datos) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(comunidad, telegram_id) DO UPDATE SET telefono = excluded.telefono, datos = excluded.datos",
+                self._fila_miembro(comunidad, miembro)
+            )
+        return True
+
+    def registrar_lote(self, registros):
+        """Guarda varios registros en una sola transacción (un solo commit a disco).
+
+        Cada registro es (telegram_id, datos, comunidad, miembro): la
+        comunidad y si el telegram_id figura en ella los resuelve quien
+        encola, con el backend de comunidades activo, que puede no ser este
+        store. Los registros no agregan miembros: eso lo sigue decidiendo el
+        administrador.
+        """
+        ahora = time.time()
+        conn = conexion(self.ruta)
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO registros (telegram_id, comunidad, miembro, datos, creado) VALUES (?, ?, ?, ?, ?)",
+                [(str(telegram_id), comunidad.lower() if comunidad else None, bool(miembro),
+                  json.dumps(datos, ensure_ascii=False), ahora)
+                 for telegram_id, datos, comunidad, miembro in registros]
+            )
+
+    @staticmethod
+    def _fila_miembro(comunidad, miembro):
+        telegram_id = miembro.get('telegram_id')
+        telefono = miembro.get('telefono')
+        return (comunidad, str(telegram_id) if telegram_id is not None else None,
+                normalizar_telefono(telefono) if telefono else None, json.dumps(miembro, ensure_ascii=False))
+
+
+def importar_json(directorio, store):
+    """Copia cada comunidades/<nombre>.json al store. Devuelve cuántas importó."""
+    total = 0
+    for archivo in sorted(os.listdir(directorio)):
+        if not archivo.endswith('.json'):
+            continue
+        filepath = os.path.join(directorio, archivo)
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                info = json.load(f)
+        except Exception as e:
+            log.error("ERROR al importar '%s': %s", filepath, e)
+            continue
+        store.guardar_comunidad(archivo[:-len('.json')], info)
+        total += 1
+    return total
+
+
+if __name__ == '__main__':
+    directorio = sys.argv[1] if len(sys.argv) > 1 else 'comunidades'
+    ruta = sys.argv[2] if len(sys.argv) > 2 else COMUNIDADES_DB
+    total = importar_json(directorio, SqliteCommunityStore(ruta))
+    print(f"--- {total} comunidades importadas a '{ruta}'. ---")
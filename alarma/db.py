@@ -0,0 +1,47 @@
+import os
+import sqlite3
+import threading
+import time
+
+# 💾 Base SQLite compartida por todos los workers de gunicorn
+ESTADO_DB = os.getenv("ESTADO_DB", "estado.sqlite3")
+
+_local = threading.local()
+
+
+def conexion(ruta=ESTADO_DB):
+    """Conexión SQLite de este hilo para `ruta`, en modo WAL.
+
+    sqlite3 no permite compartir una conexión entre hilos, así que cada hilo
+    abre la suya y la reutiliza. WAL deja leer mientras otro proceso escribe.
+    """
+    conexiones = getattr(_local, "conexiones", None)
+    if conexiones is None:
+        conexiones = _local.conexiones = {}
+    conn = conexiones.get(ruta)
+    if conn is None:
+        conn = sqlite3.connect(ruta, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conexiones[ruta] = conn
+    return conn
+
+
+class Periodico:
+    """Dice si ya toca una tarea de mantenimiento, como borrar filas viejas de una tabla.
+
+    `toca()` devuelve True como mucho una vez cada `segundos`, aunque lo
+    llamen varios hilos a la vez.
+    """
+
+    def __init__(self, segundos=60):
+        self.segundos = segundos
+        self._ultima = 0
+        self._lock = threading.Lock()
+
+    def toca(self):
+        ahora = time.monotonic()
+        with self._lock:
+            if ahora - self._ultima < self.segundos:
+                return False
+            self._ultima = ahora
+            return True
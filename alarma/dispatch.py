@@ -0,0 +1,162 @@
+import json
+import os
+import queue
+import time
+import uuid
+
+from db import ESTADO_DB, Periodico, conexion
+from fanout import fan_out
+from hilos import iniciar_hilos
+from logs import logger
+
+log = logger("dispatch")
+
+# 📬 Hilos que despachan las alertas en segundo plano
+DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", "2"))
+# 🗂️ Cuántas alertas recientes se recuerdan para GET /api/alert/<id>
+DISPATCH_MAX_HISTORIAL = int(os.getenv("DISPATCH_MAX_HISTORIAL", "500"))
+# 💾 Cada cuántos segundos se guarda el progreso de una alerta mientras se envía
+DISPATCH_GUARDAR_CADA = float(os.getenv("DISPATCH_GUARDAR_CADA", "0.5"))
+
+_cola = queue.Queue()
+_tablas = False
+_limpieza = Periodico()
+
+
+def _conexion():
+    # El progreso vive en SQLite: GET /api/alert/<id> puede caer en cualquier worker
+    global _tablas
+    conn = conexion(ESTADO_DB)
+    if not _tablas:
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS alertas (alert_id TEXT PRIMARY KEY, estado TEXT, total INTEGER, "
+                "enviados INTEGER, fallidos INTEGER, datos TEXT, creada REAL, iniciada REAL, terminada REAL, "
+                "error TEXT)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS alerta_resultados "
+                "(alert_id TEXT, clave TEXT, ok INTEGER, resultado TEXT, PRIMARY KEY (alert_id, clave))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS alertas_creada ON alertas (creada)")
+        _tablas = True
+    return conn
+
+
+def _actualizar(alert_id, **cambios):
+    columnas = ", ".join(f"{columna} = ?" for columna in cambios)
+    with _conexion() as conn:
+        conn.execute(f"UPDATE alertas SET {columnas} WHERE alert_id = ?", (*cambios.values(), alert_id))
+
+
+def _guardar_resultados(alert_id, pendientes):
+    """Guarda en una transacción los resultados juntados desde la última vez."""
+    if not pendientes:
+        return
+    enviados = sum(1 for _, resultado in pendientes if resultado["ok"])
+    with _conexion() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO alerta_resultados (alert_id, clave, ok, resultado) VALUES (?, ?, ?, ?)",
+            [(alert_id, clave, resultado["ok"], json.dumps(resultado, ensure_ascii=False, default=str))
+             for clave, resultado in pendientes]
+        )
+        conn.execute(
+            "UPDATE alertas SET enviados = enviados + ?, fallidos = fallidos + ? WHERE alert_id = ?",
+            (enviados, len(pendientes) - enviados, alert_id)
+        )
+    pendientes.clear()
+
+
+def _al_completar(alert_id, pendientes):
+    # Un commit por envío serían cientos por alerta: se juntan y se guardan cada tanto
+    ultimo = [time.monotonic()]
+
+    def registrar(clave, resultado):
+        pendientes.append((clave, resultado))
+        if time.monotonic() - ultimo[0] >= DISPATCH_GUARDAR_CADA:
+            _guardar_resultados(alert_id, pendientes)
+            ultimo[0] = time.monotonic()
+    return registrar
+
+
+def _worker():
+    while True:
+        alert_id, tareas = _cola.get()
+        pendientes = []
+        try:
+            _actualizar(alert_id, estado="enviando", iniciada=time.time())
+            fan_out(tareas, al_completar=_al_completar(alert_id, pendientes))
+            _guardar_resultados(alert_id, pendientes)
+            _actualizar(alert_id, estado="completada", terminada=time.time())
+        except Exception as e:
+            log.exception("ERROR al despachar la alerta %s: %s", alert_id, e)
+            try:
+                _guardar_resultados(alert_id, pendientes)
+                _actualizar(alert_id, estado="error", error=str(e), terminada=time.time())
+            except Exception as e_guardar:
+                log.exception("ERROR al guardar el estado de la alerta %s: %s", alert_id, e_guardar)
+        finally:
+            _cola.task_done()
+
+
+_workers = iniciar_hilos(_worker, DISPATCH_WORKERS)
+
+
+def _limpiar(conn):
+    if not _limpieza.toca():
+        return
+    fila = conn.execute(
+        "SELECT creada FROM alertas ORDER BY creada DESC LIMIT 1 OFFSET ?", (DISPATCH_MAX_HISTORIAL,)
+    ).fetchone()
+    if fila:
+        conn.execute("DELETE FROM alertas WHERE creada <= ?", fila)
+        conn.execute("DELETE FROM alerta_resultados WHERE alert_id NOT IN (SELECT alert_id FROM alertas)")
+
+
+def nuevo_alert_id():
+    return uuid.uuid4().hex
+
+
+def encolar_alerta(tareas, alert_id=None, **datos):
+    """Encola las tareas de una alerta y devuelve su alert_id sin esperar los envíos."""
+    alert_id = alert_id or nuevo_alert_id()
+    ahora = time.time()
+    with _conexion() as conn:
+        conn.execute(
+            "INSERT INTO alertas (alert_id, estado, total, enviados, fallidos, datos, creada) "
+            "VALUES (?, 'en_cola', ?, 0, 0, ?, ?)",
+            (alert_id, len(tareas), json.dumps(datos, ensure_ascii=False, default=str), ahora)
+        )
+        _limpiar(conn)
+    _cola.put((alert_id, tareas))
+    return alert_id
+
+
+def estado_alerta(alert_id):
+    """Devuelve el progreso de la alerta, o None si no se conoce."""
+    conn = _conexion()
+    fila = conn.execute(
+        "SELECT estado, total, enviados, fallidos, datos, creada, iniciada, terminada, error "
+        "FROM alertas WHERE alert_id = ?", (alert_id,)
+    ).fetchone()
+    if fila is None:
+        return None
+    estado, total, enviados, fallidos, datos, creada, iniciada, terminada, error = fila
+    resultados = {
+        clave: json.loads(resultado) for clave, resultado in
+        conn.execute("SELECT clave, resultado FROM alerta_resultados WHERE alert_id = ?", (alert_id,))
+    }
+    progreso = {
+        "alert_id": alert_id,
+        "estado": estado,
+        "total": total,
+        "enviados": enviados,
+        "fallidos": fallidos,
+        "resultados": resultados,
+        "creada": creada,
+        **json.loads(datos),
+    }
+    for clave, valor in (("iniciada", iniciada), ("terminada", terminada), ("error", error)):
+        if valor is not None:
+            progreso[clave] = valor
+    return progreso
@@ -0,0 +1,38 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# 🚀 Máximo de envíos simultáneos (mensajes de Telegram + llamadas de Twilio)
+FANOUT_MAX_CONCURRENCIA = int(os.getenv("FANOUT_MAX_CONCURRENCIA", "16"))
+
+
+def _ejecutar(funcion, args):
+    try:
+        resultado = funcion(*args)
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    # Las funciones de envío del servidor devuelven None cuando fallan
+    if resultado is None:
+        return {"ok": False, "error": "sin respuesta"}
+    return {"ok": True, "resultado": resultado}
+
+
+def fan_out(tareas, max_concurrencia=None, al_completar=None):
+    """Ejecuta todas las tareas a la vez y devuelve un dict clave -> resultado.
+
+    `tareas` es una lista de tuplas (clave, funcion, args). La clave identifica
+    al destinatario, por ejemplo "telegram:12345" o "llamada:+51999999999".
+    Si se pasa `al_completar(clave, resultado)`, se llama cada vez que termina
+    un envío, para poder reportar el progreso.
+    """
+    if not tareas:
+        return {}
+    limite = max_concurrencia or FANOUT_MAX_CONCURRENCIA
+    resultados = {}
+    with ThreadPoolExecutor(max_workers=min(limite, len(tareas))) as pool:
+        futuros = {pool.submit(_ejecutar, funcion, args): clave for clave, funcion, args in tareas}
+        for futuro in as_completed(futuros):
+            clave = futuros[futuro]
+            resultados[clave] = futuro.result()
+            if al_completar:
+                al_completar(clave, resultados[clave])
+    return resultados
@@ -0,0 +1,181 @@
+import math
+import os
+
+try:
+    import numpy as np
+except ImportError:  # Sin NumPy las distancias se calculan una por una en Python
+    np = None
+
+# 🗺️ Lado de cada celda de la grilla en metros
+GEO_CELDA_M = float(os.getenv("GEO_CELDA_M", "500"))
+
+RADIO_TIERRA_M = 6371000
+M_POR_GRADO = 111320
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Distancia en metros entre dos puntos (lat/lon en grados)."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dlat = p2 - p1
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dlon / 2) ** 2
+    return 2 * RADIO_TIERRA_M * math.asin(math.sqrt(a))
+
+
+def coordenadas(geo):
+    """(lat, lon) de un dict {"lat", "lon"} como floats, o None si falta o no es válido."""
+    if not isinstance(geo, dict):
+        return None
+    try:
+        lat, lon = float(geo['lat']), float(geo['lon'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+class GeoIndex:
+    """Grilla de celdas de GEO_CELDA_M metros con los puntos de una comunidad.
+
+    Cada punto es (lat, lon, valor). Una consulta solo mira las celdas que
+    pueden tener puntos a la distancia pedida, así que no recorre toda la
+    comunidad. El ancho de la celda en longitud se ajusta a la latitud media
+    de los puntos (una comunidad ocupa unos pocos kilómetros).
+
+    Si NumPy está instalado, las coordenadas también se guardan en arreglos
+    contiguos y ordenar a toda la comunidad por distancia es un solo cálculo
+    vectorizado en lugar de un haversine por miembro.
+    """
+
+    __slots__ = ("celda_m", "total", "_dlat", "_dlon", "_celdas", "_lat", "_lon", "_cos_lat", "_valores")
+
+    def __init__(self, puntos, celda_m=GEO_CELDA_M):
+        puntos = list(puntos)
+        self.celda_m = celda_m
+        self.total = len(puntos)
+        lat_media = sum(p[0] for p in puntos) / len(puntos) if puntos else 0.0
+        self._dlat = celda_m / M_POR_GRADO
+        self._dlon = celda_m / (M_POR_GRADO * max(math.cos(math.radians(lat_media)), 0.01))
+        self._celdas = {}
+        for punto in puntos:
+            self._celdas.setdefault(self._celda(punto[0], punto[1]), []).append(punto)
+        if np is not None and puntos:
+            self._lat = np.radians(np.fromiter((p[0] for p in puntos), dtype=np.float64, count=len(puntos)))
+            self._lon = np.radians(np.fromiter((p[1] for p in puntos), dtype=np.float64, count=len(puntos)))
+            self._cos_lat = np.cos(self._lat)
+            self._valores = [p[2] for p in puntos]
+        else:
+            self._lat = self._lon = self._cos_lat = self._valores = None
+
+    def _celda(self, lat, lon):
+        return math.floor(lat / self._dlat), math.floor(lon / self._dlon)
+
+    def _anillo(self, cx, cy, r):
+        """Celdas ocupadas a distancia de Chebyshev exactamente `r` de (cx, cy)."""
+        if r == 0:
+            celdas = [(cx, cy)]
+        else:
+            celdas = [(cx + dx, cy + dy) for dx in (-r, r) for dy in range(-r, r + 1)]
+            celdas += [(cx + dx, cy + dy) for dx in range(-r + 1, r) for dy in (-r, r)]
+        return [self._celdas[c] for c in celdas if c in self._celdas]
+
+    def dentro_de(self, lat, lon, radio_m):
+        """[(distancia_m, valor)] de los puntos a radio_m metros o menos, del más cercano al más lejano."""
+        cx, cy = self._celda(lat, lon)
+        r = math.ceil(radio_m / self.celda_m)
+        if (2 * r + 1) ** 2 > len(self._celdas):
+            # Radio más grande que la comunidad: es más barato recorrer las celdas ocupadas
+            if self._lat is not None:
+                return [e for e in self._todos(lat, lon) if e[0] <= radio_m]
+            grupos = self._celdas.values()
+        else:
+            grupos = [p for anillo in range(r + 1) for p in self._anillo(cx, cy, anillo)]
+        encontrados = []
+        for grupo in grupos:
+            for plat, plon, valor in grupo:
+                distancia = haversine_m(lat, lon, plat, plon)
+                if distancia <= radio_m:
+                    encontrados.append((distancia, valor))
+        encontrados.sort(key=lambda e: e[0])
+        return encontrados
+
+    def distancias(self, lat, lon):
+        """Distancias en metros de (lat, lon) a cada punto, en el orden de construcción (requiere NumPy)."""
+        p1 = math.radians(lat)
+        a = (np.sin((self._lat - p1) / 2) ** 2
+             + math.cos(p1) * self._cos_lat * np.sin((self._lon - math.radians(lon)) / 2) ** 2)
+        return 2 * RADIO_TIERRA_M * np.arcsin(np.sqrt(a))
+
+    def _todos(self, lat, lon, k=None):
+        if self._lat is None:
+            encontrados = [(haversine_m(lat, lon, plat, plon), valor)
+                           for grupo in self._celdas.values() for plat, plon, valor in grupo]
+            encontrados.sort(key=lambda e: e[0])
+            return encontrados[:k]
+        distancias = self.distancias(lat, lon)
+        if k is not None and k < self.total:
+            # Solo se ordenan los k primeros
+            orden = np.argpartition(distancias, k)[:k]
+            orden = orden[np.argsort(distancias[orden])]
+        else:
+            orden = np.argsort(distancias)
+        valores = self._valores
+        return [(d, valores[i]) for d, i in zip(distancias[orden].tolist(), orden.tolist())]
+
+    def ordenar(self, lat, lon):
+        """Todos los valores, del punto más cercano al más lejano (sin las distancias)."""
+        if self._lat is None:
+            return [valor for _, valor in self._todos(lat, lon)]
+        valores = self._valores
+        return [valores[i] for i in np.argsort(self.distancias(lat, lon)).tolist()]
+
+    def cercanos(self, lat, lon, k=None):
+        """[(distancia_m, valor)] de los k puntos más cercanos (todos si k es None), ordenados."""
+        if k is None or k >= self.total:
+            return self._todos(lat, lon)
+        cx, cy = self._celda(lat, lon)
+        encontrados = []
+        r = 0
+        while True:
+            if (2 * r + 1) ** 2 > len(self._celdas):
+                # Consulta lejos de la comunidad: recorrer anillos vacíos saldría más caro
+                return self._todos(lat, lon, k)
+            for grupo in self._anillo(cx, cy, r):
+                encontrados.extend((haversine_m(lat, lon, plat, plon), valor) for plat, plon, valor in grupo)
+            # Lo que queda sin mirar está al menos a r celdas de distancia
+            if len(encontrados) >= k:
+                encontrados.sort(key=lambda e: e[0])
+                if encontrados[k - 1][0] <= r * self.celda_m:
+                    return encontrados[:k]
+            r += 1
+
+
+def _benchmark(n_miembros=20000, repeticiones=20):
+    """Compara ordenar a toda la comunidad con NumPy contra el bucle en Python."""
+    import random
+    import timeit
+
+    random.seed(1)
+    puntos = [(-12.05 + random.uniform(-0.05, 0.05), -77.04 + random.uniform(-0.05, 0.05), i)
+              for i in range(n_miembros)]
+    indice = GeoIndex(puntos)
+    lat, lon = -12.051, -77.041
+
+    def con_bucle():
+        encontrados = [(haversine_m(lat, lon, plat, plon), valor) for plat, plon, valor in puntos]
+        encontrados.sort(key=lambda e: e[0])
+        return [valor for _, valor in encontrados]
+
+    pruebas = [("bucle", con_bucle)]
+    if np is None:
+        print("--- NumPy no está instalado: solo se mide el bucle en Python. ---")
+    else:
+        pruebas.append(("numpy", lambda: indice.ordenar(lat, lon)))
+    for nombre, funcion in pruebas:
+        segundos = min(timeit.repeat(funcion, number=repeticiones, repeat=5)) / repeticiones
+        print(f"{nombre:>6}: {segundos * 1000:.3f} ms para ordenar {n_miembros} miembros por distancia")
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -0,0 +1,9 @@
+import threading
+
+
+def iniciar_hilos(destino, cantidad=1, args=()):
+    """Arranca `cantidad` hilos daemon que ejecutan `destino(*args)` y los devuelve."""
+    hilos = [threading.Thread(target=destino, args=args, daemon=True) for _ in range(cantidad)]
+    for hilo in hilos:
+        hilo.start()
+    return hilos
@@ -0,0 +1,59 @@
+import fcntl
+import os
+import threading
+import time
+
+from logs import logger
+
+log = logger("leader")
+
+# 🔒 Archivo de bloqueo que decide qué proceso lee las actualizaciones de Telegram
+LIDER_LOCK = os.getenv("LIDER_LOCK", "/tmp/alarma-telegram.lock")
+# ⏱️ Cada cuántos segundos los demás workers intentan tomar el relevo
+LIDER_REINTENTO = float(os.getenv("LIDER_REINTENTO", "2"))
+
+
+class LeaderElection:
+    """Elige un único proceso líder con un flock sobre un archivo.
+
+    El bloqueo lo suelta el sistema operativo cuando el proceso muere, así que
+    si el líder cae otro worker lo toma en el siguiente intento (unos segundos).
+    Los workers que no son líderes solo atienden HTTP.
+    """
+
+    def __init__(self, ruta=LIDER_LOCK, reintento=LIDER_REINTENTO):
+        self.ruta = ruta
+        self.reintento = reintento
+        self.es_lider = False
+        self._archivo = None
+        self._hilo = None
+
+    def intentar(self):
+        if self.es_lider:
+            return True
+        archivo = open(self.ruta, 'a+')
+        try:
+            fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            archivo.close()
+            return False
+        archivo.seek(0)
+        archivo.truncate()
+        archivo.write(str(os.getpid()))
+        archivo.flush()
+        # Se guarda la referencia: si el archivo se cierra, se pierde el bloqueo
+        self._archivo = archivo
+        self.es_lider = True
+        return True
+
+    def iniciar(self, al_ser_lider):
+        """Intenta ser líder en segundo plano y llama `al_ser_lider()` al conseguirlo."""
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._esperar_turno, args=(al_ser_lider,), daemon=True)
+            self._hilo.start()
+
+    def _esperar_turno(self, al_ser_lider):
+        while not self.intentar():
+            time.sleep(self.reintento)
+        log.info("Proceso %d es el líder: atiende las actualizaciones de Telegram", os.getpid())
+        al_ser_lider()
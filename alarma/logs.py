@@ -0,0 +1,110 @@
+"""Logging del servidor: niveles, formato estructurado y escritura sin bloquear.
+
+Los módulos piden su logger con `logger("servidor")` y registran con
+formato perezoso: `log.debug("Update %s ignorado", update_id)` no arma el
+texto si el nivel está apagado. Los registros van a una cola en memoria y
+un hilo aparte los formatea y los escribe en stdout, así un handler nunca
+espera al pipe de los logs. Si la cola se llena se descartan y se cuentan:
+en cuanto vuelve a haber lugar se escribe un aviso con cuántos se perdieron,
+y `descartados()` da el total desde que arrancó el proceso.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+# 🔊 Nivel mínimo: DEBUG, INFO, WARNING, ERROR
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# 🧾 "texto" o "json" (una línea JSON por evento, fácil de filtrar)
+LOG_FORMATO = os.getenv("LOG_FORMATO", "texto")
+# 🚧 Registros en espera como máximo antes de empezar a descartar
+LOG_MAX_COLA = int(os.getenv("LOG_MAX_COLA", "10000"))
+
+# Atributos propios de LogRecord; el resto son los `extra=` de cada llamada
+_ESTANDAR = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class FormatoJson(logging.Formatter):
+    def format(self, record):
+        evento = {
+            "ts": round(record.created, 3),
+            "nivel": record.levelname,
+            "modulo": record.name,
+            "mensaje": record.getMessage(),
+        }
+        evento.update((clave, valor) for clave, valor in vars(record).items() if clave not in _ESTANDAR)
+        if record.exc_info:
+            evento["error"] = self.formatException(record.exc_info)
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+class ColaSinBloqueo(logging.handlers.QueueHandler):
+    """QueueHandler que nunca bloquea y deja el formateo al hilo que escribe."""
+
+    def __init__(self, cola):
+        super().__init__(cola)
+        self.descartados = 0
+        self._sin_avisar = 0
+
+    def prepare(self, record):
+        # QueueHandler formatea aquí, en el hilo del handler; se difiere al listener
+        return record
+
+    def _aviso(self):
+        return logging.LogRecord(
+            "alarma.logs", logging.WARNING, __file__, 0,
+            "Cola de logs llena: se descartaron %d registros (%d desde el inicio)",
+            (self._sin_avisar, self.descartados), None
+        )
+
+    def enqueue(self, record):
+        # Handler.handle ya toma el lock del handler: los contadores no necesitan otro
+        try:
+            if self._sin_avisar:
+                self.queue.put_nowait(self._aviso())
+                self._sin_avisar = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+            self._sin_avisar += 1
+
+
+_lock = threading.Lock()
+_listener = None
+_handler = None
+
+
+def configurar():
+    global _listener, _handler
+    with _lock:
+        if _listener is not None:
+            return
+        destino = logging.StreamHandler(sys.stdout)
+        if LOG_FORMATO == "json":
+            destino.setFormatter(FormatoJson())
+        else:
+            destino.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        cola = queue.Queue(maxsize=LOG_MAX_COLA)
+        raiz = logging.getLogger("alarma")
+        _handler = ColaSinBloqueo(cola)
+        raiz.addHandler(_handler)
+        raiz.setLevel(LOG_LEVEL)
+        raiz.propagate = False
+        _listener = logging.handlers.QueueListener(cola, destino)
+        _listener.start()
+        # Al salir se escribe lo que quede en la cola
+        atexit.register(_listener.stop)
+
+
+def logger(nombre):
+    configurar()
+    return logging.getLogger(f"alarma.{nombre}")
+
+
+def descartados():
+    """Registros de log perdidos por tener la cola llena desde que arrancó el proceso."""
+    return _handler.descartados if _handler is not None else 0
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from logs import logger
+
+log = logger("polling")
+
+# ⏳ Segundos que Telegram mantiene abierta cada petición de getUpdates
+POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", "30"))
+# 🧵 Hilos que procesan las actualizaciones mientras se sigue consultando
+POLLING_HILOS = int(os.getenv("POLLING_HILOS", "4"))
+# 🩹 Cada cuántos segundos se retoman las actualizaciones que quedaron a medias
+POLLING_RECUPERAR_CADA = int(os.getenv("POLLING_RECUPERAR_CADA", "30"))
+# 📨 Solo se piden los tipos de actualización que el bot usa
+ALLOWED_UPDATES = ["message"]
+
+
+class UpdatePoller:
+    """Bucle de long polling de getUpdates sin pausas fijas.
+
+    En cuanto llega un lote se pide el siguiente; cada actualización se pasa a
+    un pool de hilos, así el polling y el procesamiento se solapan. Usa el
+    TelegramClient compartido, que mantiene la conexión abierta. Si se pasa un
+    UpdateStore, el offset se lee al arrancar y cada lote se guarda como
+    pendiente antes de confirmar el offset: lo que quede a medias (un error,
+    un proceso que muere) se retoma cada POLLING_RECUPERAR_CADA segundos.
+    """
+
+    def __init__(self, client, procesar, store=None, hilos=POLLING_HILOS, timeout=POLLING_TIMEOUT,
+                 allowed_updates=ALLOWED_UPDATES, recuperar_cada=POLLING_RECUPERAR_CADA):
+        self.client = client
+        self.procesar = procesar
+        self.store = store
+        self.timeout = timeout
+        self.allowed_updates = allowed_updates
+        self.recuperar_cada = recuperar_cada
+        self.offset = None
+        self._pool = ThreadPoolExecutor(max_workers=hilos)
+        self._hilo = None
+        self._ultima_recuperacion = 0
+
+    def iniciar(self):
+        if self._hilo is None:
+            if self.store is not None:
+                self.offset = self.store.leer_offset()
+            self._hilo = threading.Thread(target=self._bucle, daemon=True)
+            self._hilo.start()
+
+    def _procesar(self, update):
+        try:
+            self.procesar(update)
+        except Exception as e:
+            log.exception("ERROR al procesar la actualización %s: %s", update.get('update_id'), e)
+
+    def _recuperar(self):
+        ahora = time.monotonic()
+        if self.store is None or ahora - self._ultima_recuperacion < self.recuperar_cada:
+            return
+        self._ultima_recuperacion = ahora
+        for update in self.store.pendientes():
+            log.info("Se retoma la actualización %s", update["update_id"])
+            self._pool.submit(self._procesar, update)
+
+    def obtener_lote(self):
+        payload = {"timeout": self.timeout, "allowed_updates": self.allowed_updates}
+        if self.offset is not None:
+            payload["offset"] = self.offset
+        # La lectura tiene que esperar más que el long polling de Telegram
+        lectura = self.timeout + self.client.timeout[1]
+        data = self.client.call("getUpdates", payload, timeout=(self.client.timeout[0], lectura))
+        if data is None:
+            return None
+        return data.get("result", [])
+
+    def _bucle(self):
+        espera = 1
+        while True:
+            updates = self.obtener_lote()
+            if updates is None:
+                log.warning("ERROR al obtener actualizaciones de Telegram, reintento en %ss", espera)
+                time.sleep(espera)
+                espera = min(espera * 2, 30)
+                continue
+            espera = 1
+            if updates:
+                self.offset = updates[-1]["update_id"] + 1
+                if self.store is not None:
+                    # Primero quedan guardados; recién entonces se confirma el offset a Telegram
+                    self.store.registrar_lote(updates)
+                    self.store.guardar_offset(self.offset)
+                for update in updates:
+                    self._pool.submit(self._procesar, update)
+            self._recuperar()
@@ -0,0 +1,214 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from db import ESTADO_DB, Periodico, conexion
+from logs import logger
+from telegram_client import LimiteExcedido
+
+log = logger("rate_limit")
+
+# 🚦 Límites de la Bot API: ~30 mensajes/s en total, 1/s por chat y 20/min por grupo
+TELEGRAM_LIMITE_GLOBAL = float(os.getenv("TELEGRAM_LIMITE_GLOBAL", "30"))
+TELEGRAM_LIMITE_CHAT = float(os.getenv("TELEGRAM_LIMITE_CHAT", "1"))
+TELEGRAM_LIMITE_GRUPO_MIN = float(os.getenv("TELEGRAM_LIMITE_GRUPO_MIN", "20"))
+TELEGRAM_HILOS_ENVIO = int(os.getenv("TELEGRAM_HILOS_ENVIO", "16"))
+
+# 🥇 Prioridades: menor número sale primero
+PRIORIDAD_GRUPO = 0
+PRIORIDAD_ALERTA = 1
+PRIORIDAD_RESPUESTA = 2
+
+GLOBAL = "telegram"
+
+
+class TokenBuckets:
+    """Token buckets compartidos por todos los workers, en una tabla SQLite.
+
+    Los límites de Telegram son por token del bot y el CPS de Twilio por
+    cuenta: con buckets en memoria cada worker de gunicorn tendría su propio
+    cupo y N workers mandarían N veces más. `tomar` revisa y descuenta todos
+    los buckets de un envío en una sola transacción.
+    """
+
+    def __init__(self, ruta=ESTADO_DB):
+        self.ruta = ruta
+        self._limpieza = Periodico()
+        with conexion(self.ruta) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS limites "
+                "(clave TEXT PRIMARY KEY, tokens REAL, actualizado REAL, pausa_hasta REAL DEFAULT 0)"
+            )
+
+    def tomar(self, buckets):
+        """Toma un token de cada (clave, tasa, capacidad). Devuelve (0, None) o (espera, clave que frena)."""
+        ahora = time.time()
+        claves = [clave for clave, _, _ in buckets]
+        conn = conexion(self.ruta)
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            filas = {clave: (tokens, actualizado, pausa_hasta) for clave, tokens, actualizado, pausa_hasta in
+                     conn.execute(f"SELECT clave, tokens, actualizado, pausa_hasta FROM limites "
+                                  f"WHERE clave IN ({','.join('?' * len(claves))})", claves)}
+            nuevos = []
+            frena = (0, None)
+            for clave, tasa, capacidad in buckets:
+                tokens, actualizado, pausa_hasta = filas.get(clave, (capacidad, ahora, 0))
+                tokens = min(capacidad, tokens + max(0, ahora - actualizado) * tasa)
+                espera = max(pausa_hasta - ahora, (1 - tokens) / tasa if tokens < 1 else 0)
+                if espera > frena[0]:
+                    frena = (espera, clave)
+                nuevos.append((clave, tokens - 1, ahora))
+            if frena[1] is not None:
+                return frena
+            conn.executemany(
+                "INSERT INTO limites (clave, tokens, actualizado) VALUES (?, ?, ?) "
+                "ON CONFLICT(clave) DO UPDATE SET tokens = excluded.tokens, actualizado = excluded.actualizado",
+                nuevos
+            )
+            if self._limpieza.toca():
+                # Un bucket sin uso en 5 minutos ya está lleno: no hace falta guardarlo
+                conn.execute("DELETE FROM limites WHERE actualizado < ? AND pausa_hasta < ?", (ahora - 300, ahora))
+        return 0, None
+
+    def pausar(self, clave, segundos):
+        """Nadie toma de `clave` hasta que pasen `segundos` (un 429 de Telegram)."""
+        hasta = time.time() + segundos
+        with conexion(self.ruta) as conn:
+            conn.execute(
+                "INSERT INTO limites (clave, tokens, actualizado, pausa_hasta) VALUES (?, 0, ?, ?) "
+                "ON CONFLICT(clave) DO UPDATE SET pausa_hasta = MAX(pausa_hasta, excluded.pausa_hasta)",
+                (clave, time.time(), hasta)
+            )
+
+
+def es_grupo(chat_id):
+    # En Telegram los grupos y supergrupos tienen id negativo
+    return str(chat_id).startswith('-')
+
+
+class TelegramScheduler:
+    """Cola con prioridad delante del TelegramClient que respeta los límites de la API.
+
+    Un hilo reparte los mensajes en orden de prioridad (grupo, alertas privadas,
+    respuestas a comandos) a medida que hay tokens en el bucket global, el del
+    chat y, si es un grupo, el del grupo. Un mensaje frenado por su chat no
+    bloquea a los de otros chats. Nada se descarta: lo que no cabe espera, y
+    si Telegram responde 429 el envío vuelve a la cola con su prioridad y
+    todo el reparto se pausa los `retry_after` segundos que pide. Los buckets
+    y la pausa son TokenBuckets compartidos: valen para todos los workers.
+    """
+
+    def __init__(self, client, limite_global=TELEGRAM_LIMITE_GLOBAL, limite_chat=TELEGRAM_LIMITE_CHAT,
+                 limite_grupo_min=TELEGRAM_LIMITE_GRUPO_MIN, hilos=TELEGRAM_HILOS_ENVIO, limites=None):
+        self.client = client
+        self.limite_global = limite_global
+        self.limite_chat = limite_chat
+        self.limite_grupo_min = limite_grupo_min
+        self._limites = limites or TokenBuckets()
+        # Chats frenados hasta cierto momento: no se vuelve a consultar la base por ellos antes
+        self._frenados = {}
+        self._cola = []
+        self._secuencia = itertools.count()
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=hilos)
+        self._hilo = None
+
+    def enviar_async(self, metodo, payload, prioridad=PRIORIDAD_ALERTA):
+        futuro = Future()
+        with self._cond:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._repartir, daemon=True)
+                self._hilo.start()
+            heapq.heappush(self._cola, (prioridad, next(self._secuencia), metodo, payload, futuro))
+            self._cond.notify()
+        return futuro
+
+    def enviar(self, metodo, payload, prioridad=PRIORIDAD_ALERTA):
+        """Encola la llamada y espera su resultado (None si falla)."""
+        return self.enviar_async(metodo, payload, prioridad).result()
+
+    def send_message(self, chat_id, text, reply_markup=None, parse_mode='HTML', prioridad=PRIORIDAD_ALERTA):
+        payload = {"chat_id": chat_id, "text": text}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        if reply_markup:
+            payload["reply_markup"] = reply_markup
+        return self.enviar("sendMessage", payload, prioridad)
+
+    def reservar(self, chat_id):
+        """Toma los tokens de un envío que no pasa por la cola (respuesta en el cuerpo del webhook).
+
+        Devuelve False si ese envío tendría que esperar o si hay mensajes en
+        cola: en ese caso hay que mandarlo con `enviar` para no adelantarlos.
+        """
+        with self._cond:
+            if self._cola:
+                return False
+            espera, _ = self._limites.tomar(self._buckets(chat_id))
+            return espera == 0
+
+    def _buckets(self, chat_id):
+        clave = str(chat_id)
+        buckets = [(GLOBAL, self.limite_global, self.limite_global), (f"chat:{clave}", self.limite_chat, 1)]
+        if es_grupo(clave):
+            buckets.append((f"grupo:{clave}", self.limite_grupo_min / 60, self.limite_grupo_min))
+        return buckets
+
+    def _siguiente(self):
+        """Saca el primer mensaje que puede salir ya, o devuelve cuánto esperar."""
+        ahora = time.monotonic()
+        apartados = []
+        elegido = None
+        espera_min = None
+        while self._cola:
+            item = heapq.heappop(self._cola)
+            chat_id = str(item[3].get("chat_id"))
+            frenado = self._frenados.get(chat_id, 0)
+            if frenado > ahora:
+                espera, clave = frenado - ahora, None
+            else:
+                espera, clave = self._limites.tomar(self._buckets(chat_id))
+                if espera == 0:
+                    elegido = item
+                    break
+            apartados.append(item)
+            espera_min = espera if espera_min is None else min(espera_min, espera)
+            if clave == GLOBAL:
+                # Frena el límite del bot: ningún otro mensaje puede salir ahora
+                break
+            if clave is not None:
+                self._frenados[chat_id] = ahora + espera
+        for item in apartados:
+            heapq.heappush(self._cola, item)
+        return elegido, espera_min
+
+    def _repartir(self):
+        while True:
+            with self._cond:
+                while not self._cola:
+                    self._frenados.clear()
+                    self._cond.wait()
+                item, espera = self._siguiente()
+                if item is None:
+                    self._cond.wait(timeout=espera)
+                    continue
+            self._pool.submit(self._llamar, item)
+
+    def _llamar(self, item):
+        _, _, metodo, payload, futuro = item
+        try:
+            futuro.set_result(self.client.call(metodo, payload, esperar_429=False))
+        except LimiteExcedido as e:
+            # Vuelve a la cola con su prioridad y su turno; nadie envía hasta que pase la pausa
+            log.warning("Telegram pide esperar %ss: %s a %s vuelve a la cola", e.retry_after, metodo,
+                        payload.get("chat_id"))
+            self._limites.pausar(GLOBAL, e.retry_after)
+            with self._cond:
+                heapq.heappush(self._cola, item)
+                self._cond.notify()
+        except Exception as e:
+            futuro.set_exception(e)
@@ -0,0 +1,77 @@
+import atexit
+import os
+import queue
+
+from hilos import iniciar_hilos
+from logs import logger
+
+log = logger("registros")
+
+# 📦 Máximo de registros por transacción
+REGISTRO_LOTE = int(os.getenv("REGISTRO_LOTE", "200"))
+# ⏱️ Cuánto espera el escritor a que se junten más registros antes de guardar
+REGISTRO_ESPERA = float(os.getenv("REGISTRO_ESPERA", "0.05"))
+# 🚧 Registros pendientes como máximo; por encima se rechazan en lugar de crecer sin límite
+REGISTRO_MAX_COLA = int(os.getenv("REGISTRO_MAX_COLA", "10000"))
+
+_FIN = object()
+
+
+class RegistrationWriter:
+    """Escritor en segundo plano de los registros de /api/register y MIREGISTRO.
+
+    Las peticiones solo encolan. Un hilo junta lo que llegue durante
+    REGISTRO_ESPERA segundos (hasta REGISTRO_LOTE registros) y lo guarda con
+    `store.registrar_lote` en una sola transacción: cien vecinos pulsando el
+    botón a la vez son un commit a disco, no cien.
+    """
+
+    def __init__(self, store, lote=REGISTRO_LOTE, espera=REGISTRO_ESPERA, max_cola=REGISTRO_MAX_COLA):
+        self.store = store
+        self.lote = lote
+        self.espera = espera
+        self._cola = queue.Queue(maxsize=max_cola)
+        self._hilo, = iniciar_hilos(self._escribir)
+        atexit.register(self.cerrar)
+
+    def encolar(self, telegram_id, datos, comunidad=None, miembro=False):
+        """Agrega un registro a la cola. Devuelve False si la cola está llena.
+
+        `miembro` dice si el telegram_id figura en `comunidad`; lo resuelve
+        quien encola con el backend de comunidades que esté activo.
+        """
+        try:
+            self._cola.put_nowait((telegram_id, datos, comunidad, miembro))
+        except queue.Full:
+            return False
+        return True
+
+    def _juntar_lote(self):
+        lote = [self._cola.get()]
+        while lote[-1] is not _FIN and len(lote) < self.lote:
+            try:
+                lote.append(self._cola.get(timeout=self.espera))
+            except queue.Empty:
+                break
+        return lote
+
+    def _escribir(self):
+        while True:
+            lote = self._juntar_lote()
+            terminar = lote[-1] is _FIN
+            registros = [r for r in lote if r is not _FIN]
+            if registros:
+                try:
+                    self.store.registrar_lote(registros)
+                except Exception as e:
+                    log.exception("ERROR al guardar %d registros: %s", len(registros), e)
+            if terminar:
+                return
+
+    def cerrar(self, timeout=5):
+        """Guarda lo pendiente antes de que termine el proceso."""
+        try:
+            self._cola.put(_FIN, timeout=timeout)
+        except queue.Full:
+            return
+        self._hilo.join(timeout)
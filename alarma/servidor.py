@@ -1,12 +1,33 @@
 import os
-import requests
-import json
-from flask import Flask, request, jsonify, send_from_directory, render_template
+from functools import partial
+from html import escape
+from flask import Flask, request, jsonify, send_from_directory, render_template, Response
 from flask_cors import CORS
 from twilio.rest import Client
-from twilio.twiml.voice_response import VoiceResponse
+from alert_templates import PlantillaAlerta, mensaje_tambien_reportado
+from call_campaign import CallCampaigns
+from coalescing import AlertCoalescer
+from command_router import CommandRouter
+from community_registry import CommunityRegistry
+from community_store import SqliteCommunityStore
+from dispatch import encolar_alerta, estado_alerta, nuevo_alert_id
+from geo_index import coordenadas
+from leader import LeaderElection
+from logs import descartados, logger
+from polling import UpdatePoller
+from rate_limit import PRIORIDAD_ALERTA, PRIORIDAD_GRUPO, PRIORIDAD_RESPUESTA, TelegramScheduler
+from registrations import RegistrationWriter
+from sos_sessions import SosSessionStore
+from snapshot import COMUNIDADES_SNAPSHOT
+from telegram_client import TelegramClient
+from twiml_cache import TwimlCache
+from update_queue import UpdateQueue
+from update_store import UpdateStore
+from webhook_reply import RespuestaWebhook
 
-print("--- INICIO DEL SCRIPT ---")
+log = logger("servidor")
+
+log.info("Inicio del servidor")
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 CORS(app)
@@ -16,30 +37,67 @@ TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
+WEBAPP_URL = os.getenv("WEBAPP_URL", "https://alarma-production.up.railway.app")
+TELEGRAM_BOT_USERNAME = os.getenv("TELEGRAM_BOT_USERNAME")
+TELEGRAM_MODO = os.getenv("TELEGRAM_MODO", "webhook")
+# ⚡ Con "1" el webhook encola el update y responde al instante; se procesa en otro hilo
+WEBHOOK_ASINCRONO = os.getenv("WEBHOOK_ASINCRONO", "1") == "1"
+# ↩️ Con "1" una respuesta única (como el botón de SOS) va en el cuerpo de la respuesta al webhook
+WEBHOOK_RESPUESTA_INLINE = os.getenv("WEBHOOK_RESPUESTA_INLINE", "1") == "1"
+# 🗄️ De dónde salen las comunidades: "json" (comunidades/*.json) o "sqlite"
+COMUNIDADES_BACKEND = os.getenv("COMUNIDADES_BACKEND", "json")
+# 📍 Si es mayor que 0, solo se avisa a los miembros a esa distancia (metros) de la alerta
+ALERTA_RADIO_M = float(os.getenv("ALERTA_RADIO_M", "0"))
 
 if not TELEGRAM_BOT_TOKEN:
-    print("--- ADVERTENCIA: TELEGRAM_BOT_TOKEN NO está configurado. ---")
+    log.warning("TELEGRAM_BOT_TOKEN NO está configurado")
+
+telegram = TelegramClient(TELEGRAM_BOT_TOKEN)
+telegram_envios = TelegramScheduler(telegram)
+campanas = CallCampaigns()
+updates_vistos = UpdateStore()
+sesiones_sos = SosSessionStore()
+alertas_recientes = AlertCoalescer()
+
+# 🎤 Mensaje de voz de las llamadas de emergencia
+MENSAJE_VOZ = "Emergencia, revisa tu celular."
+twiml_cache = TwimlCache()
+TWIML_POR_DEFECTO = twiml_cache.renderizar(None, None, MENSAJE_VOZ)
 
 if TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN:
     twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 else:
     twilio_client = None
-    print("--- ADVERTENCIA: Variables de Twilio NO configuradas. Las llamadas no funcionarán. ---")
+    log.warning("Variables de Twilio NO configuradas: las llamadas no funcionarán")
 
 COMUNIDADES_DIR = 'comunidades'
 
+if COMUNIDADES_BACKEND == 'sqlite':
+    comunidades = SqliteCommunityStore()
+else:
+    comunidades = CommunityRegistry(COMUNIDADES_DIR, snapshot=COMUNIDADES_SNAPSHOT)
+comunidades.iniciar_vigilancia()
+# Los registros se guardan en SQLite aunque las comunidades vengan de los JSON
+registros = RegistrationWriter(comunidades if COMUNIDADES_BACKEND == 'sqlite' else SqliteCommunityStore())
+
 def load_community_json(comunidad_nombre):
-    filepath = os.path.join(COMUNIDADES_DIR, f"{comunidad_nombre.lower()}.json")
-    if not os.path.exists(filepath):
-        print(f"--- Archivo JSON NO encontrado: {filepath} ---")
-        return None
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            comunidad_info = json.load(f)
-            return comunidad_info
-    except Exception as e:
-        print(f"--- ERROR al cargar '{filepath}': {e} ---")
-        return None
+    comunidad_info = comunidades.get(comunidad_nombre)
+    if comunidad_info is None:
+        log.info("Comunidad '%s' NO encontrada", comunidad_nombre)
+    return comunidad_info
+
+def webapp_url(comunidad_nombre=None):
+    """URL de la WebApp: la del JSON de la comunidad (`webapp_url`) o, si no tiene, WEBAPP_URL.
+
+    Se lee del registro en cada uso, así un cambio en el JSON rige sin reiniciar.
+    """
+    info = comunidades.get(comunidad_nombre) if comunidad_nombre else None
+    if isinstance(info, dict):
+        return info.get('webapp_url') or info.get('url_base_webapp') or WEBAPP_URL
+    return WEBAPP_URL
+
+def get_community_by_chat_id(chat_id):
+    return comunidades.por_chat_id(chat_id)
 
 @app.route('/healthz')
 def health_check():
@@ -60,16 +118,37 @@ def get_comunidad_data(comunidad):
         return jsonify(comunidad_info)
     return jsonify({}), 404
 
+@app.route('/api/comunidad_por_chat/<chat_id>', methods=['GET'])
+def get_comunidad_by_chat_id_api(chat_id):
+    comunidad_nombre = get_community_by_chat_id(chat_id)
+    if not comunidad_nombre:
+        log.warning("No se encontró la comunidad para el chat_id %s", chat_id)
+        return jsonify({"error": "Comunidad no encontrada"}), 404
+
+    comunidad_info = load_community_json(comunidad_nombre)
+    if not comunidad_info:
+        return jsonify({"error": "Datos de comunidad no encontrados"}), 404
+
+    return jsonify({**comunidad_info, "comunidad": comunidad_nombre})
+
 @app.route('/api/alert', methods=['POST'])
 def handle_alert():
-    print("--- Alerta recibida (POST). ---")
-    data = request.json
-    
+    log.debug("Alerta recibida (POST)")
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Datos de alerta inválidos"}), 400
+
     comunidad_nombre = data.get('comunidad')
-    user_telegram = data.get('user_telegram', {})
+    # `or {}`: la WebApp puede mandar null en lugar de omitir el campo
+    user_telegram = data.get('user_telegram') or {}
+    ubicacion_datos = data.get('ubicacion') or {}
+    if not isinstance(user_telegram, dict) or not isinstance(ubicacion_datos, dict):
+        return jsonify({"error": "Datos de alerta inválidos"}), 400
+    if comunidad_nombre is not None and not isinstance(comunidad_nombre, str):
+        return jsonify({"error": "Datos de alerta inválidos"}), 400
     user_name = user_telegram.get('first_name', 'Anónimo')
     
-    print(f"--- Alerta activada por: {user_name} en la comunidad: {comunidad_nombre} ---")
+    log.info("Alerta activada por %s en la comunidad %s", user_name, comunidad_nombre)
 
     if not comunidad_nombre:
         return jsonify({"error": "Nombre de comunidad no proporcionado"}), 400
@@ -79,137 +158,299 @@ def handle_alert():
         return jsonify({"error": f"Comunidad '{comunidad_nombre}' no encontrada"}), 404
 
     chat_id = comunidad_info.get('chat_id')
-    miembros = comunidad_info.get('miembros', [])
+    indice = comunidades.miembros(comunidad_nombre)
 
     if not chat_id:
         return jsonify({"error": "ID del chat de Telegram no configurado para esta comunidad"}), 500
 
-    lat = data.get('ubicacion', {}).get('lat')
-    lon = data.get('ubicacion', {}).get('lon')
+    lat = ubicacion_datos.get('lat')
+    lon = ubicacion_datos.get('lon')
     map_link = f"https://www.google.com/maps/search/?api=1&query={lat},{lon}" if lat and lon else "Ubicación no disponible"
-    user_id = user_telegram.get('id', 'N/A')
-    user_mention = f"<a href='tg://user?id={user_id}'>{user_name}</a>"
-    
+    user_id = user_telegram.get('id')
+    if not user_id:
+        # La WebApp abierta desde el botón del grupo no trae al usuario: se usa quien pulsó SOS
+        user_id = sesiones_sos.consumir(comunidad_nombre)
+        reportante = indice.por_telegram_id.get(str(user_id)) if user_id else None
+        if reportante:
+            user_name = reportante.get('nombre', user_name)
+            log.debug("Usuario identificado por su SOS: %s", user_name)
+    user_id = user_id or 'N/A'
+
     tipo = data.get('tipo', 'Alerta no especificada')
     descripcion = data.get('descripcion', 'Sin descripción')
     direccion = data.get('direccion', 'Dirección no disponible')
 
-    miembros_a_notificar = [m for m in miembros if m.get('alertas_activadas') and str(m.get('telegram_id')) != str(user_id)]
-    
-    if miembros_a_notificar:
-        print("--- Enviando alertas privadas a miembros... ---")
-        for miembro in miembros_a_notificar:
-            id_miembro = miembro.get('telegram_id')
-            nombre_miembro = miembro.get('nombre', 'miembro')
-            mensaje_privado = (
-                f"<b>🚨 ALERTA DE EMERGENCIA 🚨</b>\n"
-                f"<b>Tipo:</b> {tipo}\n"
-                f"<b>Comunidad:</b> {comunidad_nombre.upper()}\n"
-                f"<b>Usuario que activó la alarma:</b> {user_mention}\n"
-                f"<b>Descripción:</b> {descripcion}\n"
-                f"<b>Ubicación:</b> <a href='{map_link}'>Ver en Google Maps</a>\n"
-                f"<b>Dirección:</b> {direccion}\n\n"
-                f"¡{nombre_miembro}, por favor, revisa el grupo para más detalles!"
-            )
-            send_telegram_message(id_miembro, mensaje_privado)
-    
+    alert_id = nuevo_alert_id()
+    enviar_al_grupo = partial(send_telegram_message, prioridad=PRIORIDAD_GRUPO)
+
+    alerta_original = alertas_recientes.registrar(comunidad_nombre, tipo, lat, lon, alert_id)
+    if alerta_original:
+        # Mismo incidente reportado por otro vecino: solo se avisa al grupo
+        aviso = mensaje_tambien_reportado(user_id, user_name, descripcion)
+        encolar_alerta([(f"grupo:{chat_id}", enviar_al_grupo, (chat_id, aviso))],
+                       alert_id=alert_id, comunidad=comunidad_nombre, coalescida_en=alerta_original)
+        log.info("Alerta fundida con %s: solo se avisa al grupo", alerta_original)
+        # Se devuelve el alert_id del aviso al grupo para poder seguirlo; el incidente es `coalescida_en`
+        return jsonify({"status": "Alerta ya reportada, se avisó al grupo.", "alert_id": alert_id,
+                        "coalescida_en": alerta_original}), 202
+
+    # Con ubicación, los mensajes y llamadas salen primero hacia los vecinos más cercanos
+    ubicacion = coordenadas(ubicacion_datos)
+    if ubicacion:
+        miembros_a_notificar = indice.destinatarios(excluir_telegram_id=user_id, lat=ubicacion[0],
+                                                    lon=ubicacion[1], radio_m=ALERTA_RADIO_M)
+    else:
+        miembros_a_notificar = indice.destinatarios(excluir_telegram_id=user_id)
+
+    plantilla = PlantillaAlerta(comunidad_nombre, tipo, user_id, user_name, descripcion, map_link, direccion)
+    # El grupo va primero: es el aviso que más gente ve
+    tareas = [(f"grupo:{chat_id}", enviar_al_grupo, (chat_id, plantilla.grupo))]
+    for miembro in miembros_a_notificar:
+        id_miembro = miembro.get('telegram_id')
+        mensaje_privado = plantilla.privado(miembro.get('nombre', 'miembro'))
+        tareas.append((f"telegram:{id_miembro}", send_telegram_message, (id_miembro, mensaje_privado)))
+
     if twilio_client and TWILIO_PHONE_NUMBER:
-        print("--- Iniciando llamadas telefónicas. ---")
+        twiml_cache.renderizar(comunidad_nombre, alert_id, MENSAJE_VOZ)
         for miembro in miembros_a_notificar:
             numero_telefono = miembro.get('telefono')
             if numero_telefono:
-                print(f"--- Llamando a un miembro de la comunidad... ---")
-                try:
-                    make_phone_call(numero_telefono)
-                except Exception as e:
-                    print(f"--- ERROR al hacer llamada: {e} ---")
-
-    mensaje_grupo = (
-        f"<b>🚨 ALERTA ROJA ACTIVADA EN LA COMUNIDAD {comunidad_nombre.upper()}</b>\n"
-        f"<b>Activada por:</b> {user_mention}\n"
-        f"<b>Descripción:</b> {descripcion}\n"
-        f"<b>Ubicación:</b> <a href='{map_link}'>Ver en Google Maps</a>\n"
-        f"<b>Dirección:</b> {direccion}\n\n"
-        f"ℹ️ Se han enviado notificaciones a los miembros registrados y se ha iniciado el protocolo de llamadas."
-    )
-    send_telegram_message(chat_id, mensaje_grupo)
+                tareas.append((f"llamada:{numero_telefono}", make_phone_call, (numero_telefono, alert_id)))
+
+    encolar_alerta(tareas, alert_id=alert_id, comunidad=comunidad_nombre)
+    log.info("Alerta %s encolada con %d notificaciones", alert_id, len(tareas),
+             extra={"alert_id": alert_id, "comunidad": comunidad_nombre})
+    return jsonify({"status": "Alerta en proceso.", "alert_id": alert_id}), 202
 
-    print("--- Alerta procesada exitosamente. ---")
-    return jsonify({"status": "Alerta enviada."})
+@app.route('/api/alert/<alert_id>', methods=['GET'])
+def get_alert_status(alert_id):
+    estado = estado_alerta(alert_id)
+    if estado is None:
+        return jsonify({"error": "Alerta no encontrada"}), 404
+    estado["llamadas"] = campanas.progreso(alert_id)
+    return jsonify(estado)
 
-def make_phone_call(to_number):
+def make_phone_call(to_number, alert_id=None):
     global twilio_client, TWILIO_PHONE_NUMBER
-    mensaje_voz = "Emergencia, revisa tu celular."
-    response = VoiceResponse()
-    response.say(mensaje_voz, voice='woman', language='es-ES')
-    try:
+    # El TwiML se sirve desde la caché; Twilio solo recibe la URL
+    twiml_url = f"{WEBAPP_URL}/twilio-voice/{alert_id}" if alert_id else f"{WEBAPP_URL}/twilio-voice"
+
+    def crear(numero):
         call = twilio_client.calls.create(
-            twiml=str(response),
-            to=to_number,
-            from_=TWILIO_PHONE_NUMBER
+            url=twiml_url,
+            to=numero,
+            from_=TWILIO_PHONE_NUMBER,
+            status_callback=f"{WEBAPP_URL}/twilio-voice/status",
+            status_callback_event=['initiated', 'ringing', 'answered', 'completed']
         )
-    except Exception:
-        raise
+        return call.sid
+
+    return campanas.llamar(alert_id, to_number, crear)
+
+@app.route('/twilio-voice', methods=['GET', 'POST'])
+def twilio_voice():
+    return Response(TWIML_POR_DEFECTO, mimetype='application/xml')
+
+@app.route('/twilio-voice/<alert_id>', methods=['GET', 'POST'])
+def twilio_voice_alerta(alert_id):
+    # Si la alerta no está en la caché (otro worker o reinicio) se usa el mensaje genérico
+    documento = twiml_cache.por_alerta(alert_id) or TWIML_POR_DEFECTO
+    return Response(documento, mimetype='application/xml')
+
+@app.route('/twilio-voice/status', methods=['POST'])
+def twilio_voice_status():
+    sid = request.form.get('CallSid')
+    estado = request.form.get('CallStatus')
+    if not sid or not estado:
+        return "", 400
+    secuencia = request.form.get('SequenceNumber')
+    secuencia = int(secuencia) if secuencia and secuencia.isdigit() else None
+    if campanas.actualizar_estado(sid, estado, secuencia=secuencia, duracion=request.form.get('CallDuration')):
+        log.info("Llamada %s: %s", sid, estado)
+    return "", 204
 
-def send_telegram_message(chat_id, text, parse_mode='HTML'):
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    payload = {
-        "chat_id": chat_id,
-        "text": text,
-        "parse_mode": parse_mode
+def send_telegram_message(chat_id, text, reply_markup=None, parse_mode='HTML', prioridad=PRIORIDAD_ALERTA):
+    resultado = telegram_envios.send_message(chat_id, text, reply_markup=reply_markup,
+                                             parse_mode=parse_mode, prioridad=prioridad)
+    if resultado is not None:
+        log.debug("Mensaje enviado a %s", chat_id)
+    return resultado
+
+# Comandos del bot: `sos`, `/sos` y `/sos@<TELEGRAM_BOT_USERNAME>` van al mismo comando
+comandos = CommandRouter(bot=TELEGRAM_BOT_USERNAME)
+
+def responder_por_api(chat_id, text, reply_markup=None):
+    return send_telegram_message(chat_id, text, reply_markup=reply_markup, prioridad=PRIORIDAD_RESPUESTA)
+
+def membresia(telegram_id, comunidad=None):
+    """(comunidad, es_miembro) según el backend activo de comunidades.
+
+    Sin comunidad se busca aquella donde ya figura ese telegram_id.
+    """
+    if not comunidad:
+        encontrada = comunidades.comunidad_de(telegram_id)
+        return encontrada, encontrada is not None
+    indice = comunidades.miembros(comunidad)
+    return comunidad.lower(), indice is not None and str(telegram_id) in indice.por_telegram_id
+
+def registrar_usuario(message, origen):
+    user = message.get('from', {})
+    if user.get('id'):
+        comunidad, miembro = membresia(user['id'], get_community_by_chat_id(message['chat']['id']))
+        registros.encolar(user['id'], {
+            "nombre": user.get('first_name', ''),
+            "username": user.get('username'),
+            "origen": origen,
+        }, comunidad=comunidad, miembro=miembro)
+
+@comandos.comando('miregistro')
+def comando_miregistro(message, args, responder):
+    registrar_usuario(message, "MIREGISTRO")
+    reply_markup = {
+        "inline_keyboard": [[{
+            "text": "Obtener mi ID",
+            "web_app": { "url": webapp_url(get_community_by_chat_id(message['chat']['id'])) }
+        }]]
     }
+    responder(message['chat']['id'], "Presiona el botón para obtener tu ID de Telegram.", reply_markup=reply_markup)
+
+@comandos.comando('sos', en_linea=True)
+def comando_sos(message, args, responder):
+    chat_id = message['chat']['id']
+    comunidad_nombre = get_community_by_chat_id(chat_id)
+    if comunidad_nombre:
+        user_name = message.get('from', {}).get('first_name', '')
+        user_id = message.get('from', {}).get('id')
+        if user_id:
+            sesiones_sos.registrar(comunidad_nombre, user_id)
+        reply_markup = {
+            "inline_keyboard": [[{
+                "text": "🚨 Enviar Alerta Roja",
+                "url": f"{webapp_url(comunidad_nombre)}/?comunidad={comunidad_nombre}"
+            }]]
+        }
+        responder(
+            chat_id,
+            f"🚨 {escape(user_name)} ha activado una emergencia. Presiona el botón para enviar una alerta roja.",
+            reply_markup=reply_markup
+        )
+    else:
+        log.warning("No se encontró la comunidad para el chat_id %s", chat_id)
+        responder(chat_id, "Lo siento, no pude encontrar la comunidad asociada a este grupo.")
+
+@comandos.comando('miregistro2222')
+def comando_miregistro2222(message, args, responder):
+    registrar_usuario(message, "miregistro2222")
+    responder(message['chat']['id'], "👐 <b>REGISTRADO</b> 👐\n🦾 Bienvenido al sistema 🦾")
+
+@comandos.comando('diagnostico', 'diagnóstico', chats=('group', 'supergroup'))
+def comando_diagnostico(message, args, responder):
+    chat_id = message['chat']['id']
+    comunidad_nombre = get_community_by_chat_id(chat_id)
+    if not comunidad_nombre:
+        responder(chat_id, "❌ Este chat no está registrado.")
+        return
+    indice = comunidades.miembros(comunidad_nombre)
+    estado_twilio = "✅ CONFIGURADO" if (twilio_client and TWILIO_PHONE_NUMBER) else "❌ NO CONFIGURADO"
+    miembros = indice.por_telegram_id if indice else {}
+    diagnostico = (
+        f"🔧 <b>DIAGNÓSTICO DEL SISTEMA</b>\n\n"
+        f"<b>Comunidad:</b> {escape(comunidad_nombre.upper())}\n"
+        f"<b>Estado Twilio:</b> {estado_twilio}\n"
+        f"<b>Miembros con Telegram:</b> {len(miembros)}\n"
+        f"<b>Con alertas activadas:</b> {len(indice.con_alertas) if indice else 0}\n"
+        f"<b>Updates en cola:</b> {updates_webhook.pendientes()}\n"
+        f"<b>Logs descartados:</b> {descartados()}"
+    )
+    responder(chat_id, diagnostico)
+
+def process_update(update, responder=responder_por_api):
+    message = update.get('message')
+    if message:
+        comandos.despachar(message, responder)
+
+def process_update_once(update, responder=responder_por_api):
+    # Un mismo update puede llegar dos veces (reintentos de Telegram, varios workers)
+    update_id = update.get('update_id')
+    if update_id is None:
+        process_update(update, responder)
+        return
+    if not updates_vistos.reclamar(update_id, update):
+        log.debug("Update %s ya procesado o en curso, se ignora", update_id)
+        return
     try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        print(f"--- Mensaje enviado exitosamente a {chat_id}. ---")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"--- ERROR al enviar mensaje a {chat_id}: {e} ---")
-        return None
+        process_update(update, responder)
+    except Exception:
+        # Queda pendiente: se retoma más tarde en lugar de perderse
+        if not updates_vistos.liberar(update_id):
+            log.error("Update %s descartado: se agotaron los intentos", update_id)
+        raise
+    updates_vistos.terminar(update_id)
+
+updates_webhook = UpdateQueue(process_update_once)
+
+def responde_en_linea(update):
+    """Comandos de una sola respuesta rápida: se atienden dentro del webhook para responder en su cuerpo."""
+    message = update.get('message')
+    if not WEBHOOK_RESPUESTA_INLINE or not message:
+        return False
+    comando, _ = comandos.resolver(message)
+    return comando is not None and comando.en_linea
 
 @app.route('/webhook', methods=['POST'])
 def webhook():
+    update = request.get_json(silent=True)
+    if not isinstance(update, dict):
+        return jsonify({"status": "ok"}), 200
+    if WEBHOOK_ASINCRONO and not responde_en_linea(update):
+        if not updates_webhook.encolar(update):
+            # Cola llena: Telegram reintentará este update más tarde
+            log.warning("Cola del webhook llena, se rechaza el update %s", update.get('update_id'))
+            return jsonify({"status": "ocupado"}), 503
+        return jsonify({"status": "ok"}), 200
+    respuesta = RespuestaWebhook(telegram_envios) if WEBHOOK_RESPUESTA_INLINE else responder_por_api
     try:
-        update = request.json
-        message = update.get('message')
-        if message:
-            chat_id = message['chat']['id']
-            text = message.get('text', '')
-            if text == 'MIREGISTRO':
-                webapp_url = "https://alarma-production.up.railway.app"
-                payload = {
-                    "chat_id": chat_id,
-                    "text": "Presiona el botón para obtener tu ID de Telegram.",
-                    "reply_markup": {
-                        "inline_keyboard": [
-                            [
-                                {
-                                    "text": "Obtener mi ID",
-                                    "web_app": { "url": webapp_url }
-                                }
-                            ]
-                        ]
-                    }
-                }
-                send_telegram_message(chat_id, payload)
+        process_update_once(update, respuesta)
     except Exception as e:
-        print(f"--- ERROR GENERAL en el webhook: {e} ---")
-    
+        log.exception("ERROR GENERAL en el webhook: %s", e)
+    cuerpo = respuesta.finalizar() if WEBHOOK_RESPUESTA_INLINE else None
+    if cuerpo:
+        log.debug("Respuesta enviada en el cuerpo del webhook a %s", cuerpo['chat_id'])
+        return jsonify(cuerpo), 200
     return jsonify({"status": "ok"}), 200
 
+@app.route('/api/comandos/metricas', methods=['GET'])
+def metricas_comandos():
+    return jsonify(comandos.metricas())
+
 @app.route('/api/register', methods=['POST'])
 def register_id():
     try:
-        data = request.json
+        data = request.get_json(silent=True) or {}
         telegram_id = data.get('telegram_id')
-        if telegram_id:
-            return jsonify({"status": "ID recibido y registrado."}), 200
-        else:
+        if not telegram_id:
             return jsonify({"error": "ID no proporcionado"}), 400
+        if data.get('comunidad') is not None and not isinstance(data.get('comunidad'), str):
+            return jsonify({"error": "Comunidad inválida"}), 400
+        datos = {clave: valor for clave, valor in data.items() if clave not in ('telegram_id', 'comunidad')}
+        datos["origen"] = "api"
+        comunidad, miembro = membresia(telegram_id, data.get('comunidad'))
+        if not registros.encolar(telegram_id, datos, comunidad=comunidad, miembro=miembro):
+            return jsonify({"error": "Demasiados registros en curso, intenta de nuevo."}), 503
+        return jsonify({"status": "ID recibido y registrado."}), 202
     except Exception as e:
         return jsonify({"error": "Error interno del servidor"}), 500
 
 
+# Con TELEGRAM_MODO=polling el bot lee getUpdates en lugar de recibir el webhook.
+# Se arranca al importar para que funcione con gunicorn; solo el worker líder
+# consulta a Telegram y el resto atiende HTTP.
+if TELEGRAM_MODO == 'polling':
+    poller = UpdatePoller(telegram, process_update_once, store=updates_vistos)
+    # Referencia global: si el objeto se libera, se cierra el archivo y se pierde el bloqueo
+    lider = LeaderElection()
+    lider.iniciar(poller.iniciar)
+
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
     app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,144 @@
+"""Snapshot binario de las comunidades, generado a partir de los JSON.
+
+Uso:  python snapshot.py [directorio_comunidades] [archivo_snapshot]
+
+El archivo tiene una cabecera, un índice y los datos de cada comunidad en
+formato marshal (de la librería estándar). Se abre con mmap: los workers de
+gunicorn comparten las páginas del archivo y al arrancar solo leen el índice,
+que ya trae los chat_id y los telegram_id de los miembros de cada comunidad. Los miembros de una comunidad se
+decodifican la primera vez que se piden. El índice guarda también el mtime y
+tamaño de cada JSON de origen, así el registro solo relee los que cambiaron.
+"""
+import marshal
+import mmap
+import os
+import struct
+import sys
+
+from logs import logger
+
+log = logger("snapshot")
+
+# 📦 Snapshot opcional: si no existe, las comunidades se cargan desde los JSON
+COMUNIDADES_SNAPSHOT = os.getenv("COMUNIDADES_SNAPSHOT", "comunidades.snapshot")
+
+MAGIC = b"ALRMSNP2"
+_CABECERA = struct.Struct("<8sHI")
+_ENTRADA = struct.Struct("<HIIQIqq")
+
+
+def telegram_ids(info):
+    """telegram_id (como str) de los miembros de una comunidad con el formato de sus JSON."""
+    lista = info.get('miembros', []) if isinstance(info, dict) else info
+    if not isinstance(lista, list):
+        return []
+    return [str(miembro['telegram_id']) for miembro in lista
+            if isinstance(miembro, dict) and miembro.get('telegram_id') is not None]
+
+
+def generar(directorio, ruta):
+    """Compila todos los JSON del directorio en un snapshot. Devuelve cuántas comunidades incluyó."""
+    import json
+
+    entradas = []
+    for archivo in sorted(os.listdir(directorio)):
+        if not archivo.endswith('.json'):
+            continue
+        filepath = os.path.join(directorio, archivo)
+        st = os.stat(filepath)
+        with open(filepath, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        chats = [str(info[clave]) for clave in ('chat_id', 'telegram_chat_id')
+                 if isinstance(info, dict) and info.get(clave)]
+        entradas.append((archivo[:-len('.json')].lower().encode('utf-8'), "\n".join(chats).encode('utf-8'),
+                         "\n".join(telegram_ids(info)).encode('utf-8'), marshal.dumps(info),
+                         st.st_mtime_ns, st.st_size))
+
+    indice_len = sum(_ENTRADA.size + len(nombre) + len(chats) + len(ids) for nombre, chats, ids, *_ in entradas)
+    offset = _CABECERA.size + indice_len
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'wb') as f:
+        f.write(_CABECERA.pack(MAGIC, marshal.version, len(entradas)))
+        for nombre, chats, ids, datos, mtime_ns, size in entradas:
+            f.write(_ENTRADA.pack(len(nombre), len(chats), len(ids), offset, len(datos), mtime_ns, size))
+            f.write(nombre)
+            f.write(chats)
+            f.write(ids)
+            offset += len(datos)
+        for _, _, _, datos, _, _ in entradas:
+            f.write(datos)
+    # Reemplazo atómico: un worker que esté leyendo el anterior no ve un archivo a medias
+    os.replace(temporal, ruta)
+    return len(entradas)
+
+
+class Snapshot:
+    """Snapshot abierto con mmap. `entradas` es {nombre: (chat_ids, telegram_ids, (mtime_ns, size))}."""
+
+    def __init__(self, mapa, entradas, posiciones):
+        self._mapa = mapa
+        self.entradas = entradas
+        self._posiciones = posiciones
+
+    def datos(self, nombre):
+        """Decodifica los datos de una comunidad desde las páginas compartidas."""
+        offset, largo = self._posiciones[nombre]
+        return marshal.loads(self._mapa[offset:offset + largo])
+
+
+def cargar(ruta):
+    """Abre el snapshot y lee solo su índice. Devuelve None si no hay uno válido."""
+    try:
+        f = open(ruta, 'rb')
+    except FileNotFoundError:
+        return None
+    with f:
+        try:
+            mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+    try:
+        return _leer_indice(ruta, mapa)
+    except (struct.error, ValueError) as e:
+        # Un snapshot corto o corrupto no debe impedir el arranque: se vuelve a los JSON
+        log.warning("Snapshot '%s' dañado (%s), se usarán los JSON", ruta, e)
+        mapa.close()
+        return None
+
+
+def _leer_indice(ruta, mapa):
+    if len(mapa) < _CABECERA.size:
+        raise ValueError("archivo más corto que la cabecera")
+    magic, version, total = _CABECERA.unpack_from(mapa, 0)
+    if magic != MAGIC or version != marshal.version:
+        log.warning("Snapshot '%s' incompatible, se usarán los JSON", ruta)
+        mapa.close()
+        return None
+    entradas = {}
+    posiciones = {}
+    posicion = _CABECERA.size
+    for _ in range(total):
+        largo_nombre, largo_chats, largo_ids, offset, largo, mtime_ns, size = _ENTRADA.unpack_from(mapa, posicion)
+        posicion += _ENTRADA.size
+        if posicion + largo_nombre + largo_chats + largo_ids > len(mapa) or offset + largo > len(mapa):
+            raise ValueError("entrada fuera del archivo")
+        nombre = mapa[posicion:posicion + largo_nombre].decode('utf-8')
+        posicion += largo_nombre
+        chats = mapa[posicion:posicion + largo_chats].decode('utf-8')
+        posicion += largo_chats
+        ids = mapa[posicion:posicion + largo_ids].decode('utf-8')
+        posicion += largo_ids
+        entradas[nombre] = (tuple(chats.split("\n")) if chats else (), tuple(ids.split("\n")) if ids else (),
+                            (mtime_ns, size))
+        posiciones[nombre] = (offset, largo)
+    return Snapshot(mapa, entradas, posiciones)
+
+
+if __name__ == '__main__':
+    import time
+
+    directorio = sys.argv[1] if len(sys.argv) > 1 else 'comunidades'
+    ruta = sys.argv[2] if len(sys.argv) > 2 else COMUNIDADES_SNAPSHOT
+    inicio = time.perf_counter()
+    total = generar(directorio, ruta)
+    print(f"--- Snapshot '{ruta}' generado con {total} comunidades en {(time.perf_counter() - inicio) * 1000:.1f} ms. ---")
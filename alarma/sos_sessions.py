@@ -0,0 +1,43 @@
+import os
+import time
+
+from db import ESTADO_DB, conexion
+
+# ⏳ Segundos que se recuerda quién pulsó SOS en cada comunidad
+SOS_TTL = int(os.getenv("SOS_TTL", "600"))
+
+
+class SosSessionStore:
+    """Quién activó SOS en cada comunidad, compartido entre workers.
+
+    El webhook registra al usuario y /api/alert lo consume aunque la petición
+    caiga en otro worker de gunicorn. Es una tabla SQLite con clave primaria
+    por comunidad (búsqueda O(1)) y las sesiones caducan a los SOS_TTL segundos.
+    """
+
+    def __init__(self, ruta=ESTADO_DB, ttl=SOS_TTL):
+        self.ruta = ruta
+        self.ttl = ttl
+        with conexion(self.ruta) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sos_sesiones "
+                "(comunidad TEXT PRIMARY KEY, telegram_id TEXT, expira REAL)"
+            )
+
+    def registrar(self, comunidad, telegram_id):
+        with conexion(self.ruta) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sos_sesiones (comunidad, telegram_id, expira) VALUES (?, ?, ?)",
+                (comunidad.lower(), str(telegram_id), time.time() + self.ttl)
+            )
+
+    def consumir(self, comunidad):
+        """Devuelve el telegram_id de la sesión vigente y la borra, o None."""
+        with conexion(self.ruta) as conn:
+            fila = conn.execute(
+                "DELETE FROM sos_sesiones WHERE comunidad = ? RETURNING telegram_id, expira",
+                (comunidad.lower(),)
+            ).fetchone()
+        if fila is None or fila[1] < time.time():
+            return None
+        return fila[0]
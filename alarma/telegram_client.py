@@ -0,0 +1,90 @@
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from logs import logger
+
+log = logger("telegram")
+
+# ⏱️ Timeouts (conexión, lectura) en segundos para la Bot API
+TELEGRAM_CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", "3.05"))
+TELEGRAM_READ_TIMEOUT = float(os.getenv("TELEGRAM_READ_TIMEOUT", "10"))
+# 🔁 Reintentos ante errores de red, 5xx o 429
+TELEGRAM_MAX_REINTENTOS = int(os.getenv("TELEGRAM_MAX_REINTENTOS", "3"))
+# 🔌 Conexiones keep-alive que se mantienen abiertas hacia api.telegram.org
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "32"))
+
+
+class LimiteExcedido(Exception):
+    """Telegram respondió 429: no hay que volver a llamar antes de `retry_after` segundos."""
+
+    def __init__(self, metodo, retry_after):
+        super().__init__(f"429 en {metodo}, reintentar en {retry_after}s")
+        self.retry_after = retry_after
+
+
+class TelegramClient:
+    """Cliente de la Bot API con una sola sesión HTTP compartida entre hilos.
+
+    Reutiliza las conexiones TCP+TLS (keep-alive), aplica timeouts y reintenta
+    con backoff exponencial. Ante un 429 espera lo que indica `retry_after`,
+    o con `esperar_429=False` lanza LimiteExcedido para que el llamador (el
+    TelegramScheduler) reencole el envío. Igual que las funciones de envío
+    del servidor, devuelve None si falla.
+    """
+
+    def __init__(self, token, max_reintentos=TELEGRAM_MAX_REINTENTOS,
+                 timeout=(TELEGRAM_CONNECT_TIMEOUT, TELEGRAM_READ_TIMEOUT)):
+        self.base_url = f"https://api.telegram.org/bot{token}"
+        self.max_reintentos = max_reintentos
+        self.timeout = timeout
+        # El pool de urllib3 es thread-safe: los hilos del fan-out comparten conexiones
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=TELEGRAM_POOL_SIZE))
+
+    def call(self, metodo, payload=None, timeout=None, esperar_429=True):
+        url = f"{self.base_url}/{metodo}"
+        espera = 0.5
+        for intento in range(self.max_reintentos + 1):
+            ultimo = intento == self.max_reintentos
+            try:
+                response = self.session.post(url, json=payload or {}, timeout=timeout or self.timeout)
+            except requests.exceptions.RequestException as e:
+                log.warning("ERROR de red en %s (intento %d): %s", metodo, intento + 1, e)
+                if ultimo:
+                    return None
+                time.sleep(espera)
+                espera *= 2
+                continue
+
+            if response.ok:
+                return response.json()
+
+            if response.status_code == 429 or response.status_code >= 500:
+                retry_after = None
+                if response.status_code == 429:
+                    try:
+                        retry_after = response.json().get("parameters", {}).get("retry_after")
+                    except ValueError:
+                        pass
+                    if not esperar_429:
+                        raise LimiteExcedido(metodo, retry_after if retry_after is not None else 1)
+                if ultimo:
+                    break
+                time.sleep(retry_after if retry_after is not None else espera)
+                espera *= 2
+                continue
+            break
+
+        log.error("ERROR en %s: %s %s", metodo, response.status_code, response.text)
+        return None
+
+    def send_message(self, chat_id, text, reply_markup=None, parse_mode='HTML'):
+        payload = {"chat_id": chat_id, "text": text}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        if reply_markup:
+            payload["reply_markup"] = reply_markup
+        return self.call("sendMessage", payload)
@@ -0,0 +1,47 @@
+import os
+import threading
+from collections import OrderedDict
+
+from twilio.twiml.voice_response import VoiceResponse
+
+# 🗂️ Cuántos documentos TwiML se guardan (uno por alerta)
+TWIML_MAX_CACHE = int(os.getenv("TWIML_MAX_CACHE", "500"))
+
+
+class TwimlCache:
+    """TwiML de voz renderizado una sola vez por alerta.
+
+    La clave es (comunidad, alert_id, idioma, voz). Todas las llamadas de una
+    alerta piden el mismo documento a /twilio-voice/<alert_id>, así que el XML
+    se construye una vez y las peticiones a Twilio solo llevan la URL.
+    """
+
+    def __init__(self, max_entradas=TWIML_MAX_CACHE):
+        self.max_entradas = max_entradas
+        self._documentos = OrderedDict()
+        self._por_alerta = {}
+        self._lock = threading.Lock()
+
+    def renderizar(self, comunidad, alert_id, mensaje, idioma='es-ES', voz='woman'):
+        clave = (comunidad, alert_id, idioma, voz)
+        with self._lock:
+            documento = self._documentos.get(clave)
+            if documento is not None:
+                return documento
+        response = VoiceResponse()
+        response.say(mensaje, voice=voz, language=idioma)
+        documento = str(response)
+        with self._lock:
+            self._documentos[clave] = documento
+            self._por_alerta[alert_id] = clave
+            while len(self._documentos) > self.max_entradas:
+                vieja, _ = self._documentos.popitem(last=False)
+                if self._por_alerta.get(vieja[1]) == vieja:
+                    del self._por_alerta[vieja[1]]
+        return documento
+
+    def por_alerta(self, alert_id):
+        """Documento de la alerta, o None si no está (o ya salió de la caché)."""
+        with self._lock:
+            clave = self._por_alerta.get(alert_id)
+            return self._documentos.get(clave) if clave else None
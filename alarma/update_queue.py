@@ -0,0 +1,47 @@
+import os
+import queue
+
+from hilos import iniciar_hilos
+from logs import logger
+
+log = logger("webhook")
+
+# 🧵 Hilos que procesan los updates recibidos por el webhook
+WEBHOOK_HILOS = int(os.getenv("WEBHOOK_HILOS", "4"))
+# 🚧 Updates en espera como máximo; con la cola llena el webhook responde 503
+WEBHOOK_MAX_COLA = int(os.getenv("WEBHOOK_MAX_COLA", "1000"))
+
+
+class UpdateQueue:
+    """Cola acotada entre el webhook y un grupo de hilos que procesan los updates.
+
+    El webhook solo encola y responde a Telegram en milisegundos, aunque
+    enviar la respuesta tarde. Si la cola se llena `encolar` devuelve False:
+    el webhook responde con error y Telegram reintenta el update más tarde,
+    así que no se pierde y la memoria no crece sin límite.
+    """
+
+    def __init__(self, procesar, hilos=WEBHOOK_HILOS, max_cola=WEBHOOK_MAX_COLA):
+        self.procesar = procesar
+        self._cola = queue.Queue(maxsize=max_cola)
+        self._workers = iniciar_hilos(self._worker, hilos)
+
+    def encolar(self, update):
+        try:
+            self._cola.put_nowait(update)
+        except queue.Full:
+            return False
+        return True
+
+    def pendientes(self):
+        return self._cola.qsize()
+
+    def _worker(self):
+        while True:
+            update = self._cola.get()
+            try:
+                self.procesar(update)
+            except Exception as e:
+                log.exception("ERROR al procesar el update %s: %s", update.get('update_id'), e)
+            finally:
+                self._cola.task_done()
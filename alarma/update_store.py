@@ -0,0 +1,112 @@
+import json
+import os
+import time
+
+from db import ESTADO_DB, Periodico, conexion
+
+# 🕐 Cuánto tiempo se recuerdan los update_id ya procesados (Telegram guarda 24 h)
+UPDATES_VENTANA = int(os.getenv("UPDATES_VENTANA", str(24 * 3600)))
+# ⏳ Segundos que un proceso tiene reservado un update; pasado ese plazo otro lo puede retomar
+UPDATES_RESERVA = int(os.getenv("UPDATES_RESERVA", "120"))
+# 🔁 Intentos de procesar un update antes de darlo por perdido
+UPDATES_MAX_INTENTOS = int(os.getenv("UPDATES_MAX_INTENTOS", "3"))
+
+
+class UpdateStore:
+    """Offset de getUpdates persistente y estado de cada update_id.
+
+    Vive en un archivo SQLite, así que sobrevive a reinicios y lo ven todos los
+    procesos. Cada update pasa por pendiente -> procesando -> hecho.
+    `reclamar` es atómico: solo un proceso a la vez recibe True para un
+    update_id, y lo tiene reservado UPDATES_RESERVA segundos. Si el proceso
+    muere a mitad de camino la reserva vence y `pendientes` lo devuelve para
+    que otro lo retome; si falla, `liberar` lo deja pendiente de nuevo.
+    """
+
+    def __init__(self, ruta=ESTADO_DB, ventana=UPDATES_VENTANA, reserva=UPDATES_RESERVA,
+                 max_intentos=UPDATES_MAX_INTENTOS):
+        self.ruta = ruta
+        self.ventana = ventana
+        self.reserva = reserva
+        self.max_intentos = max_intentos
+        self._limpieza = Periodico()
+        with self._conexion() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS telegram_offset (id INTEGER PRIMARY KEY CHECK (id = 1), valor INTEGER)")
+            # La tabla anterior solo guardaba los update_id vistos, sin estado
+            conn.execute("DROP TABLE IF EXISTS telegram_updates")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS telegram_update_estado (update_id INTEGER PRIMARY KEY, "
+                "estado TEXT, reservado_hasta REAL, intentos INTEGER, datos TEXT, visto REAL)"
+            )
+
+    def _conexion(self):
+        return conexion(self.ruta)
+
+    def leer_offset(self):
+        fila = self._conexion().execute("SELECT valor FROM telegram_offset WHERE id = 1").fetchone()
+        return fila[0] if fila else None
+
+    def guardar_offset(self, offset):
+        with self._conexion() as conn:
+            conn.execute(
+                "INSERT INTO telegram_offset (id, valor) VALUES (1, ?) "
+                "ON CONFLICT(id) DO UPDATE SET valor = MAX(valor, excluded.valor)",
+                (offset,)
+            )
+
+    def registrar_lote(self, updates):
+        """Guarda los updates como pendientes antes de confirmar el offset a Telegram."""
+        ahora = time.time()
+        with self._conexion() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO telegram_update_estado "
+                "(update_id, estado, reservado_hasta, intentos, datos, visto) VALUES (?, 'pendiente', 0, 0, ?, ?)",
+                [(update["update_id"], json.dumps(update, ensure_ascii=False), ahora) for update in updates]
+            )
+
+    def reclamar(self, update_id, update=None):
+        """True si este proceso se queda con el update: nuevo, pendiente o con la reserva vencida."""
+        ahora = time.time()
+        with self._conexion() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO telegram_update_estado "
+                "(update_id, estado, reservado_hasta, intentos, datos, visto) VALUES (?, 'procesando', ?, 1, ?, ?)",
+                (update_id, ahora + self.reserva,
+                 json.dumps(update, ensure_ascii=False) if update is not None else None, ahora)
+            )
+            if cursor.rowcount == 0:
+                cursor = conn.execute(
+                    "UPDATE telegram_update_estado SET estado = 'procesando', reservado_hasta = ?, "
+                    "intentos = intentos + 1 WHERE update_id = ? AND intentos < ? AND "
+                    "(estado = 'pendiente' OR (estado = 'procesando' AND reservado_hasta < ?))",
+                    (ahora + self.reserva, update_id, self.max_intentos, ahora)
+                )
+            if self._limpieza.toca():
+                conn.execute("DELETE FROM telegram_update_estado WHERE visto < ?", (ahora - self.ventana,))
+        return cursor.rowcount == 1
+
+    def terminar(self, update_id):
+        with self._conexion() as conn:
+            conn.execute("UPDATE telegram_update_estado SET estado = 'hecho' WHERE update_id = ?", (update_id,))
+
+    def liberar(self, update_id):
+        """Deja pendiente un update cuyo procesamiento falló. Devuelve False si ya no quedan intentos."""
+        with self._conexion() as conn:
+            fila = conn.execute(
+                "UPDATE telegram_update_estado SET estado = 'pendiente', reservado_hasta = 0 "
+                "WHERE update_id = ? RETURNING intentos",
+                (update_id,)
+            ).fetchone()
+        return fila is not None and fila[0] < self.max_intentos
+
+    def pendientes(self, limite=100):
+        """Updates que hay que retomar: reserva vencida, o pendientes desde hace más de una reserva."""
+        ahora = time.time()
+        filas = self._conexion().execute(
+            "SELECT datos FROM telegram_update_estado WHERE datos IS NOT NULL AND intentos < ? AND "
+            "((estado = 'procesando' AND reservado_hasta < ?) OR (estado = 'pendiente' AND visto < ?)) "
+            "ORDER BY update_id LIMIT ?",
+            (self.max_intentos, ahora, ahora - self.reserva, limite)
+        ).fetchall()
+        return [json.loads(datos) for datos, in filas]
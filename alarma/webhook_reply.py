@@ -0,0 +1,33 @@
+from rate_limit import PRIORIDAD_RESPUESTA
+
+
+class RespuestaWebhook:
+    """Junta las respuestas a un update para devolverlas en el cuerpo del webhook.
+
+    Telegram acepta una llamada a un método como respuesta al webhook, lo
+    que ahorra un viaje HTTPS. Solo cabe una: si el update generó un único
+    mensaje y el limitador lo deja salir ya, `finalizar` devuelve el cuerpo
+    {"method": "sendMessage", ...}. Si hubo varios mensajes se mandan todos
+    por el cliente, en orden, y `finalizar` devuelve None.
+    """
+
+    def __init__(self, envios, parse_mode='HTML', prioridad=PRIORIDAD_RESPUESTA):
+        self.envios = envios
+        self.parse_mode = parse_mode
+        self.prioridad = prioridad
+        self.mensajes = []
+
+    def __call__(self, chat_id, text, reply_markup=None):
+        payload = {"chat_id": chat_id, "text": text}
+        if self.parse_mode:
+            payload["parse_mode"] = self.parse_mode
+        if reply_markup:
+            payload["reply_markup"] = reply_markup
+        self.mensajes.append(payload)
+
+    def finalizar(self):
+        if len(self.mensajes) == 1 and self.envios.reservar(self.mensajes[0]["chat_id"]):
+            return {"method": "sendMessage", **self.mensajes[0]}
+        for payload in self.mensajes:
+            self.envios.enviar_async("sendMessage", payload, self.prioridad)
+        return None
@@ -5,6 +5,7 @@ from datetime import datetime
 import os
 import json
 import requests
+from requests.adapters import HTTPAdapter
 
 # 📦 Twilio para llamadas
 from twilio.rest import Client
@@ -27,6 +28,14 @@ TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 # 🌐 URL base de tu servidor (cambiar por tu dominio real)
 BASE_URL = os.getenv('BASE_URL', 'https://tu-servidor.com')
 
+# ⏱️ Timeouts (conexión, lectura) en segundos para la Bot API
+TELEGRAM_TIMEOUT = (float(os.getenv('TELEGRAM_CONNECT_TIMEOUT', '3.05')), float(os.getenv('TELEGRAM_READ_TIMEOUT', '10')))
+
+# 🔌 Una sola sesión HTTP para la Bot API: reutiliza las conexiones keep-alive
+# (es una app aparte con su propio Procfile, por eso no importa el cliente de alarma/)
+telegram_session = requests.Session()
+telegram_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=int(os.getenv('TELEGRAM_POOL_SIZE', '32'))))
+
 # 🎯 Cliente Twilio
 client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 
@@ -197,7 +206,7 @@ def enviar_telegram(chat_id, mensaje):
     }
 
     try:
-        response = requests.post(url, json=payload)
+        response = telegram_session.post(url, json=payload, timeout=TELEGRAM_TIMEOUT)
         if response.ok:
             print(f"✅ Mensaje Telegram enviado al grupo {chat_id}")
         else:
@@ -218,7 +227,7 @@ def enviar_mensaje_telegram(chat_id, mensaje, keyboard=None):
         payload["reply_markup"] = keyboard
 
     try:
-        response = requests.post(url, json=payload)
+        response = telegram_session.post(url, json=payload, timeout=TELEGRAM_TIMEOUT)
         if response.ok:
             print(f"✅ Mensaje con botón enviado al chat {chat_id}")
         else: